@@ -0,0 +1,499 @@
+"""
+Offline benchmarks for seedify.py.
+
+Runs the batch pipeline (parse input, resolve seeds, fetch recommendations,
+name and create the playlist) against FakeSpotify, a local stand-in for
+spotipy.Spotify that serves synthetic or recorded responses with configurable
+latency and 429 injection. No network access or credentials are needed.
+
+Usage:
+    python benchmark.py --sizes 100,10000 --inputs m3u,folder --latency 0.02
+    python benchmark.py --sizes 100000 --inputs m3u --json results.json
+"""
+import argparse
+import contextlib
+import hashlib
+import inspect
+import io
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import spotipy
+
+import seedify
+
+MARKETS = ['AD', 'AR', 'AT', 'AU', 'BE', 'BR', 'CA', 'CH', 'DE', 'DK', 'ES', 'FI', 'FR', 'GB', 'IE',
+           'IT', 'JP', 'MX', 'NL', 'NO', 'NZ', 'PL', 'PT', 'SE', 'US']
+GENRES = ['rock', 'pop', 'indie', 'jazz', 'hip hop', 'electronic', 'folk', 'soul', 'metal', 'classical']
+SEARCH_QUERY_PATTERN = re.compile(r'artist:(.*) track:(.*)')
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz)
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+
+def synthetic_id(prefix, value):
+    """Return a stable 22-character ID like Spotify's."""
+    return (prefix + hashlib.md5(str(value).encode()).hexdigest())[:22]
+
+
+class FakeSpotify:
+    """
+    A stand-in for spotipy.Spotify with the methods seedify.py uses.
+    Every call sleeps for `latency` seconds and fails with a 429 carrying a
+    Retry-After header with probability `throttle_rate`. Responses come from
+    `recording` (see RecordingSpotify) when it has one for the call, and are
+    generated deterministically otherwise.
+    """
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, retry_after=0, catalog_size=50000,
+                 recording=None, seed=0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.catalog_size = catalog_size
+        self.recording = recording or {}
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.replay_misses = Counter()
+        self.lock = threading.Lock()
+        self.playlists = {}
+        self.track_json = {}
+
+    def _call(self, endpoint, *args, **kwargs):
+        with self.lock:
+            self.calls[endpoint] += 1
+            throttle = self.random.random() < self.throttle_rate
+            if throttle:
+                self.throttled[endpoint] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttle:
+            raise spotipy.exceptions.SpotifyException(
+                429, -1, f"{endpoint}: API rate limit exceeded",
+                headers={'Retry-After': str(self.retry_after)}
+            )
+        if not self.recording:
+            return None
+        recorded = self.recording.get(recording_key(endpoint, args, kwargs))
+        if recorded is None:
+            with self.lock:
+                self.replay_misses[endpoint] += 1
+        return recorded
+
+    def _artist(self, index):
+        return {
+            'id': synthetic_id('ar', index),
+            'name': f'Artist {index}',
+            'type': 'artist',
+            'uri': f'spotify:artist:{synthetic_id("ar", index)}',
+            'external_urls': {'spotify': f'https://open.spotify.com/artist/{synthetic_id("ar", index)}'},
+        }
+
+    def _track(self, index):
+        index = index % self.catalog_size
+        track_id = synthetic_id('tr', index)
+        artist = self._artist(index % (self.catalog_size // 10 or 1))
+        return {
+            'id': track_id,
+            'name': f'Track {index}',
+            'type': 'track',
+            'uri': f'spotify:track:{track_id}',
+            'popularity': index % 101,
+            'duration_ms': 120000 + index % 240000,
+            'explicit': index % 7 == 0,
+            'artists': [artist],
+            'available_markets': MARKETS,
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+            'album': {
+                'id': synthetic_id('al', index // 12),
+                'name': f'Album {index // 12}',
+                'release_date': f'{1960 + index % 65}-01-01',
+                'release_date_precision': 'day',
+                'artists': [artist],
+                'available_markets': MARKETS,
+                'images': [{'url': f'https://i.scdn.co/image/{track_id}{size}', 'height': size, 'width': size}
+                           for size in (640, 300, 64)],
+            },
+        }
+
+    def _tracks_json(self, indexes):
+        """
+        Return a JSON array of the tracks at the given catalog indexes. Each
+        track's JSON is generated once; callers parse it like a real response,
+        so every response is made of fresh objects.
+        """
+        parts = []
+        for index in indexes:
+            index = index % self.catalog_size
+            text = self.track_json.get(index)
+            if text is None:
+                text = self.track_json[index] = json.dumps(self._track(index))
+            parts.append(text)
+        return '[' + ','.join(parts) + ']'
+
+    def _index_of(self, value):
+        return int(hashlib.md5(str(value).encode()).hexdigest(), 16) % self.catalog_size
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        recorded = self._call('search', q=q, limit=limit, offset=offset, type=type, market=market)
+        if recorded is not None:
+            return recorded
+        match = SEARCH_QUERY_PATTERN.match(q)
+        artist, title = match.groups() if match else (None, q)
+        indexes = [] if 'missing' in q.lower() else [self._index_of((artist, title)) + i for i in range(limit)]
+        items = json.loads(self._tracks_json(indexes))
+        if items:
+            # The best hit carries the searched name, like the real catalogue would
+            items[0]['name'] = title
+            if artist:
+                items[0]['artists'][0]['name'] = artist
+        return {'tracks': {'items': items, 'total': len(items), 'limit': limit, 'offset': offset}}
+
+    def recommendations(self, seed_artists=None, seed_genres=None, seed_tracks=None, limit=20,
+                        country=None, **kwargs):
+        recorded = self._call('recommendations', seed_artists=seed_artists, seed_genres=seed_genres,
+                              seed_tracks=seed_tracks, limit=limit, country=country, **kwargs)
+        if recorded is not None:
+            return recorded
+        start = self._index_of(','.join(seed_tracks or []))
+        step = 1 + start % 97
+        return {
+            'tracks': json.loads(self._tracks_json(start + i * step for i in range(limit))),
+            'seeds': [{'id': seed, 'type': 'TRACK'} for seed in seed_tracks or []],
+        }
+
+    def tracks(self, tracks, market=None):
+        recorded = self._call('tracks', tracks, market=market)
+        if recorded is not None:
+            return recorded
+        found = json.loads(self._tracks_json(self._index_of(track_id) for track_id in tracks))
+        for track, track_id in zip(found, tracks):
+            track['id'] = track_id
+        return {'tracks': found}
+
+    def artists(self, artists):
+        recorded = self._call('artists', artists)
+        if recorded is not None:
+            return recorded
+        found = []
+        for artist_id in artists:
+            index = self._index_of(artist_id)
+            found.append({'id': artist_id, 'name': f'Artist {index}', 'popularity': index % 101,
+                          'genres': [GENRES[index % len(GENRES)], GENRES[(index // 3) % len(GENRES)]]})
+        return {'artists': found}
+
+    def audio_features(self, tracks=[]):
+        recorded = self._call('audio_features', tracks)
+        if recorded is not None:
+            return recorded
+        features = []
+        for track_id in tracks:
+            r = random.Random(track_id)
+            features.append({'id': track_id, 'valence': r.random(), 'energy': r.random(),
+                             'danceability': r.random(), 'acousticness': r.random(),
+                             'instrumentalness': r.random(), 'tempo': 60 + r.random() * 120})
+        return features
+
+    def me(self):
+        recorded = self._call('me')
+        return recorded if recorded is not None else {'id': 'benchmark-user'}
+
+    def user_playlist_create(self, user, name, public=True, collaborative=False, description=''):
+        recorded = self._call('user_playlist_create', user, name, public=public, collaborative=collaborative,
+                              description=description)
+        playlist = recorded or {'id': synthetic_id('pl', len(self.playlists)), 'name': name}
+        with self.lock:
+            self.playlists[playlist['id']] = []
+        return playlist
+
+    def playlist_add_items(self, playlist_id, items, position=None):
+        recorded = self._call('playlist_add_items', playlist_id, items, position=position)
+        with self.lock:
+            self.playlists.setdefault(playlist_id, []).extend(items)
+        return recorded or {'snapshot_id': 'benchmark'}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, market=None, additional_types=None):
+        self._call('playlist_items', playlist_id, fields=fields, limit=limit, offset=offset, market=market,
+                   additional_types=additional_types)
+        with self.lock:
+            items = self.playlists.get(playlist_id, [])[offset:offset + limit]
+            total = len(self.playlists.get(playlist_id, []))
+        return {
+            'items': [{'track': {'id': track_id}} for track_id in items],
+            'next': f'{playlist_id}:{offset + limit}' if offset + limit < total else None,
+        }
+
+    def next(self, result):
+        playlist_id, offset = result['next'].rsplit(':', 1)
+        return self.playlist_items(playlist_id, offset=int(offset))
+
+    def playlist_remove_all_occurrences_of_items(self, playlist_id, items, snapshot_id=None):
+        self._call('playlist_remove_all_occurrences_of_items', playlist_id, items, snapshot_id=snapshot_id)
+        removed = set(items)
+        with self.lock:
+            self.playlists[playlist_id] = [item for item in self.playlists.get(playlist_id, []) if item not in removed]
+        return {'snapshot_id': 'benchmark'}
+
+
+def recording_key(endpoint, args, kwargs):
+    """
+    Key a recorded response by endpoint and arguments. The arguments are bound
+    to the spotipy method's signature, defaults included, so a call matches its
+    recording whether an argument was passed by position or by keyword.
+    """
+    method = getattr(spotipy.Spotify, endpoint, None)
+    if method is None:
+        return json.dumps([endpoint, list(args), kwargs], sort_keys=True, default=str)
+    signature = inspect.signature(method)
+    bound = signature.bind(None, *args, **kwargs)
+    bound.apply_defaults()
+    arguments = {}
+    for name, value in bound.arguments.items():
+        kind = signature.parameters[name].kind
+        if kind == inspect.Parameter.VAR_KEYWORD:
+            arguments.update(value)
+        elif kind == inspect.Parameter.VAR_POSITIONAL:
+            arguments[name] = list(value)
+        elif name != 'self':
+            arguments[name] = value
+    return json.dumps([endpoint, arguments], sort_keys=True, default=str)
+
+
+class RecordingSpotify:
+    """
+    Wraps a real spotipy.Spotify client and records every response, so a
+    session can be replayed offline with FakeSpotify(recording=...).
+    """
+
+    def __init__(self, sp):
+        self.sp = sp
+        self.recording = {}
+
+    def __getattr__(self, name):
+        method = getattr(self.sp, name)
+
+        def record(*args, **kwargs):
+            result = method(*args, **kwargs)
+            self.recording[recording_key(name, args, kwargs)] = result
+            return result
+
+        record.__name__ = name
+        return record
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.recording, file)
+
+
+def write_m3u(path, count):
+    """Write an extended M3U playlist with `count` synthetic entries."""
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('#EXTM3U\n')
+        for i in range(count):
+            # Every 20th entry has no usable EXTINF and relies on the file name
+            if i % 20 == 0:
+                file.write(f'#EXTINF:{180 + i % 120},\n')
+            else:
+                file.write(f'#EXTINF:{180 + i % 120},Artist {i % 997} - Song {i}\n')
+            file.write(f'Music/Artist {i % 997} - Song {i}.mp3\n')
+
+
+def write_audio_folder(path, count, files_per_folder=500):
+    """Write `count` tiny tagged MP3 files, spread over subfolders."""
+    from mutagen.easyid3 import EasyID3
+
+    template = os.path.join(path, 'template.mp3')
+    os.makedirs(path, exist_ok=True)
+    with open(template, 'wb') as file:
+        file.write(MP3_FRAME * 4)
+    for i in range(count):
+        folder = os.path.join(path, f'disc{i // files_per_folder:04d}')
+        os.makedirs(folder, exist_ok=True)
+        file_path = os.path.join(folder, f'{i:06d}.mp3')
+        shutil.copyfile(template, file_path)
+        tags = EasyID3()
+        tags['artist'] = f'Artist {i % 997}'
+        tags['title'] = f'Song {i}'
+        tags.save(file_path)
+    os.remove(template)
+
+
+def run_benchmark(input_path, sp, workers=seedify.DEFAULT_WORKERS, max_length=None, criteria=None,
+                  measure_memory=True):
+    """Run the batch pipeline once and return its timings and API statistics."""
+    job = {'input': input_path, 'max_length': max_length, 'criteria': criteria or {}, 'name': 'Benchmark'}
+    calls_before = sum(sp.calls.values())
+    if measure_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    caches = seedify.Caches()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = seedify.run_job(sp, 'benchmark-user', job, caches, workers)
+    finally:
+        caches.close()
+    elapsed = time.perf_counter() - started
+    peak = None
+    if measure_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    calls = sum(sp.calls.values()) - calls_before
+    seeds = summary['input_tracks'] or 1
+    return {
+        'status': summary['status'],
+        'input_tracks': summary['input_tracks'],
+        'tracks_added': summary['tracks_added'],
+        'seconds': round(elapsed, 3),
+        'api_calls': calls,
+        'api_calls_per_seed': round(calls / seeds, 3),
+        'peak_memory_mib': round(peak / 2 ** 20, 2) if peak is not None else None,
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a description of every result that is worse than its baseline by more than tolerance."""
+    regressions = []
+    expected = {(b['input'], b['size'], b['run']): b for b in baseline}
+    for result in results:
+        base = expected.get((result['input'], result['size'], result['run']))
+        if base is None:
+            continue
+        for key in ('seconds', 'api_calls_per_seed', 'peak_memory_mib'):
+            if result.get(key) is None or base.get(key) is None:
+                continue
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{result['input']} {result['size']} {result['run']}: "
+                                   f"{key} {result[key]} > baseline {base[key]}")
+    return regressions
+
+
+def measure_startup(runs):
+    """
+    Time fresh `seedify.py` processes that exit before doing any work: `--help`
+    and a missing input path. Returns the median wall time per command.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seedify.py')
+    commands = {'help': ['--help'], 'missing input': [os.path.join(tempfile.gettempdir(), 'seedify-missing.m3u')]}
+    results = {}
+    for name, arguments in commands.items():
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script] + arguments, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=False)
+            timings.append(time.perf_counter() - start)
+        results[name] = statistics.median(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark seedify.py offline against a fake Spotify client.")
+    parser.add_argument('--sizes', default='100,10000',
+                        help="comma separated numbers of input tracks (default 100,10000)")
+    parser.add_argument('--inputs', default='m3u,folder',
+                        help="comma separated input kinds: m3u, folder (default both)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds of latency per API call")
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help="probability that an API call fails with 429")
+    parser.add_argument('--retry-after', type=float, default=0, help="Retry-After seconds sent with a 429")
+    parser.add_argument('--recording', help="JSON file of recorded responses to serve")
+    parser.add_argument('--workers', type=int, default=seedify.DEFAULT_WORKERS)
+    parser.add_argument('--max-rate', type=float, default=1e6,
+                        help="rate limiter ceiling in requests per second (default: effectively unlimited)")
+    parser.add_argument('--no-memory', action='store_true', help="skip tracemalloc, which slows the run down")
+    parser.add_argument('--json', metavar='FILE', help="also write the results to a JSON file")
+    parser.add_argument('--baseline', metavar='FILE',
+                        help="results of an earlier --json run; exit with status 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown relative to the baseline (default 0.25, i.e. 25%%)")
+    parser.add_argument('--startup', action='store_true',
+                        help="only measure process startup time instead of the pipeline")
+    parser.add_argument('--startup-runs', type=int, default=10, help="processes to start per command (default 10)")
+    parser.add_argument('--startup-budget', type=float, default=0.3,
+                        help="exit with status 1 if a median startup exceeds this many seconds (default 0.3)")
+    args = parser.parse_args()
+
+    if args.startup:
+        results = measure_startup(args.startup_runs)
+        for name, seconds in results.items():
+            print(f"{name:<14} {seconds:>7.3f}s median of {args.startup_runs}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+        slow = [name for name, seconds in results.items() if seconds > args.startup_budget]
+        if slow:
+            print(f"Startup over the {args.startup_budget}s budget: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    recording = None
+    if args.recording:
+        with open(args.recording, 'r', encoding='utf-8') as file:
+            recording = json.load(file)
+    seedify.rate_limiter.configure(args.max_rate)
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix='seedify-bench-')
+    cwd = os.getcwd()
+    try:
+        # The caches live in the working directory, so keep them out of the user's
+        os.chdir(workdir)
+        for kind in args.inputs.split(','):
+            for size in [int(size) for size in args.sizes.split(',')]:
+                input_path = os.path.join(workdir, f'{kind}-{size}')
+                if kind == 'm3u':
+                    input_path += '.m3u'
+                    write_m3u(input_path, size)
+                elif kind == 'folder':
+                    write_audio_folder(input_path, size)
+                else:
+                    parser.error(f"unknown input kind '{kind}'")
+                for run in ('cold', 'warm'):
+                    sp = FakeSpotify(args.latency, args.throttle_rate, args.retry_after, recording=recording)
+                    result = run_benchmark(input_path, sp, args.workers, measure_memory=not args.no_memory)
+                    result.update(input=kind, size=size, run=run, throttled=sum(sp.throttled.values()),
+                                  replay_misses=sum(sp.replay_misses.values()))
+                    if result['replay_misses']:
+                        print(f"{result['replay_misses']} calls weren't in the recording: {dict(sp.replay_misses)}",
+                              file=sys.stderr)
+                    results.append(result)
+                    print(f"{kind:<7} {size:>7} {run:<5} {result['seconds']:>9.3f}s "
+                          f"{result['api_calls_per_seed']:>7.2f} calls/seed "
+                          f"{result['peak_memory_mib'] if result['peak_memory_mib'] is not None else '-':>8} MiB peak "
+                          f"{result['status']}")
+                # Start each input size with empty caches
+                for name in os.listdir(workdir):
+                    if name.startswith(seedify.CACHE_FILE):
+                        os.remove(os.path.join(workdir, name))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,107 @@
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 import os
 import re
 import sys
-from cryptography.fernet import Fernet
 import datetime
-from collections import Counter
-from mutagen import File as MutagenFile
+from collections import Counter, defaultdict, deque
+import importlib
+import importlib.util
 import time
+import json
+import sqlite3
+import threading
+import argparse
+from urllib.parse import unquote, urlparse
+import random
+import difflib
+import unicodedata
+import warnings
+import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing, contextmanager, redirect_stdout
+
+class LazyModule:
+    """
+    A module that is only imported when one of its attributes is first used,
+    so invocations that never need it (--help, usage errors, a missing input)
+    don't pay for importing it.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+def lazy_import(name):
+    """Return a LazyModule for name, or None if the module isn't installed."""
+    return LazyModule(name) if importlib.util.find_spec(name) is not None else None
+
+spotipy = lazy_import('spotipy')
+np = lazy_import('numpy')
+asyncio = lazy_import('asyncio')
+
+CACHE_FILE = 'seedify_cache.db'
+JOURNAL_DIR = 'seedify_runs'
+SEARCH_CACHE_TTL_DAYS = 30
+SEARCH_CACHE_MAX_ENTRIES = 50000
+CATALOG_MAX_ENTRIES = 500000
+TAG_INDEX_MAX_ENTRIES = 1000000
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RATE = 10.0  # Spotify requests per second
+MAX_RETRIES = 5
+MAX_RETRY_AFTER = 60  # seconds; a longer Retry-After fails the request instead of stalling every caller
+DEFAULT_POOL_SIZE = 10  # Kept connections per host; raised to match --workers and --jobs
+CONNECT_TIMEOUT = 3.05  # seconds
+DEFAULT_READ_TIMEOUT = 15.0  # seconds
+DEFAULT_SERVE_HOST = '127.0.0.1'
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+RECOMMENDATION_TTL_SECONDS = 600  # How long the server reuses the recommendations for a set of seeds
+SERVER_STORE_MAX_TRACKS = 200000
+AUDIO_EXTENSIONS = ['.mp3', '.flac', '.wav', '.m4a', '.aac', '.ogg']
+PLAYLIST_EXTENSIONS = ['.m3u', '.m3u8']
+EXTINF_PATTERN = re.compile(r'[\d-]+,(.*) - (.*)')
+# Noise removed from artist and title tags before searching
+# Track numbers: '1-02 ', '01 - ', '1. ', '01 ' or '01-'; a number without a
+# leading zero must be followed by a space, so '5.6.7.8' and '2-Step' are kept
+TRACK_NUMBER_PATTERN = re.compile(r'^\s*(?:\d-\d{2}\s+|\d{1,3}\s*[-.)]\s+|0\d\s+|0\d{1,2}[-._)])(?=\S)')
+# Only the '01 - ' of a file name is removed from artists
+ARTIST_NUMBER_PATTERN = re.compile(r'^\s*\d{1,3}\s+-\s+(?=\S)')
+# Credits in brackets, or everything after a 'feat.' or 'ft.' token
+FEAT_PATTERN = re.compile(r'\s*[(\[]\s*(?:feat\.?|ft\.?|featuring)\s+[^)\]]*[)\]]|\s+(?:feat|ft)\.\s+.*$',
+                          re.IGNORECASE)
+VERSION_WORDS = r'remaster(?:ed)?|live|mono|stereo|radio edit|single version|album version|edit|mix|deluxe|bonus track|demo|explicit|clean'
+VERSION_PATTERN = re.compile(rf'\s*[(\[][^)\]]*\b(?:{VERSION_WORDS})\b[^)\]]*[)\]]', re.IGNORECASE)
+DASH_VERSION_PATTERN = re.compile(rf'\s+-\s+[^-]*\b(?:{VERSION_WORDS}|version)\b[^-]*$', re.IGNORECASE)
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+NUMBER_PATTERN = re.compile(r'\d+')
+# Minimum similarity (0-1) for a local index hit and for a remote search result
+INDEX_MATCH_THRESHOLD = 0.9
+SEARCH_MATCH_THRESHOLD = 0.6
+# Minimum artist similarity when the artist is known, so a same-titled song by someone else never matches
+ARTIST_MATCH_THRESHOLD = 0.5
+SEARCH_CANDIDATES = 5
+# Spotify takes at most 5 seeds per recommendations request and returns at most 100 tracks
+MAX_SEEDS = 5
+MAX_RECOMMENDATIONS = 100
+# Recommendations requested per track the playlist needs, leaving room for
+# duplicates, release year filters and ranking
+RECOMMENDATION_OVERFETCH = 2
+# Columns of the matrix used to rank candidates; tempo is scaled to roughly 0-1
+RANKING_FEATURES = ['valence', 'energy', 'danceability', 'acousticness', 'instrumentalness', 'tempo']
+TEMPO_SCALE = 250.0
+# How strongly explicit targets count compared to the distance from the seeds
+TARGET_WEIGHT = 2.0
 
 def load_key():
     """Load the encryption key from a file or generate a new one."""
+    from cryptography.fernet import Fernet
+
     key_file = 'key.key'
     if os.path.exists(key_file):
         with open(key_file, 'rb') as file:
@@ -23,6 +114,8 @@ def load_key():
 
 def save_credentials(client_id, client_secret):
     """Encrypt and save the Spotify credentials."""
+    from cryptography.fernet import Fernet
+
     key = load_key()
     f = Fernet(key)
     credentials = f'{client_id}:{client_secret}'.encode()
@@ -32,6 +125,8 @@ def save_credentials(client_id, client_secret):
 
 def load_credentials():
     """Load and decrypt the Spotify credentials."""
+    from cryptography.fernet import Fernet
+
     key = load_key()
     f = Fernet(key)
     with open('credentials.enc', 'rb') as file:
@@ -40,54 +135,981 @@ def load_credentials():
     client_id, client_secret = decrypted_credentials.split(':')
     return client_id, client_secret
 
-def parse_m3u(file_path):
-    """Parse an M3U playlist file and extract track information."""
-    tracks = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if line.startswith('#EXTINF:'):
-                info = line.split('#EXTINF:')[1]
-                # Extract artist and title
-                match = re.match(r'[\d-]+,(.*) - (.*)', info)
-                if match:
-                    artist = match.group(1).strip()
-                    title = match.group(2).strip()
+class DiskCache:
+    """
+    A small persistent key/value store backed by a SQLite table.
+    Values are stored as JSON, so cached misses (None) are kept as well as hits.
+    Entries older than ttl seconds are ignored, and the least recently used
+    entries are evicted once the table holds more than max_entries rows.
+    """
+    MISSING = object()
+
+    def __init__(self, path=CACHE_FILE, table='cache', ttl=None, max_entries=None):
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL lets the caches that share the file read while another one writes
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} '
+            '(key TEXT PRIMARY KEY, value TEXT, stored_at REAL, accessed_at REAL)'
+        )
+        self.conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)')
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=MISSING):
+        """Return the cached value for key, or default if absent or expired."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                f'SELECT value, stored_at FROM {self.table} WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return default
+            self.conn.execute(f'UPDATE {self.table} SET accessed_at = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """Store value under key and evict old entries if the cache is full."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now)
+            )
+            self._evict()
+            self.conn.commit()
+
+    def get_many(self, keys):
+        """Return a dict of the cached, unexpired values for the given keys."""
+        now = time.time()
+        keys = list(keys)
+        found = {}
+        with self.lock:
+            # Stay well below SQLite's limit on query parameters
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i+500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.conn.execute(
+                    f'SELECT key, value, stored_at FROM {self.table} WHERE key IN ({placeholders})', batch
+                ).fetchall()
+                for key, value, stored_at in rows:
+                    if self.ttl is None or now - stored_at <= self.ttl:
+                        found[key] = json.loads(value)
+            self.conn.executemany(
+                f'UPDATE {self.table} SET accessed_at = ? WHERE key = ?', [(now, key) for key in found]
+            )
+            self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items):
+        """Store several (key, value) pairs in one transaction."""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)',
+                [(key, json.dumps(value), now, now) for key, value in items]
+            )
+            self._evict()
+            self.conn.commit()
+
+    def items(self):
+        """Return every unexpired (key, value) pair."""
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute(f'SELECT key, value, stored_at FROM {self.table}').fetchall()
+        return [(key, json.loads(value)) for key, value, stored_at in rows
+                if self.ttl is None or now - stored_at <= self.ttl]
+
+    def keys(self, prefix=''):
+        """Return every key that starts with prefix, expired or not."""
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT key FROM {self.table} WHERE substr(key, 1, ?) = ?', (len(prefix), prefix)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete_many(self, keys):
+        """Remove the given keys in one transaction."""
+        with self.lock:
+            self.conn.executemany(f'DELETE FROM {self.table} WHERE key = ?', [(key,) for key in keys])
+            self.conn.commit()
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        count = self.conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                f'DELETE FROM {self.table} WHERE key IN '
+                f'(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def close(self):
+        """Close the database."""
+        with self.lock:
+            self.conn.close()
+
+def open_search_cache(ttl_days=SEARCH_CACHE_TTL_DAYS, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+    """Open the persistent cache used by search_track."""
+    return DiskCache(table='search', ttl=ttl_days * 86400, max_entries=max_entries)
+
+def open_genre_cache(ttl_days=SEARCH_CACHE_TTL_DAYS):
+    """Open the persistent cache of artist genres used by get_genres."""
+    return DiskCache(table='genres', ttl=ttl_days * 86400)
+
+def open_catalog(ttl_days=SEARCH_CACHE_TTL_DAYS, max_entries=CATALOG_MAX_ENTRIES):
+    """
+    Open the persistent catalog of track details (release year, popularity, ...)
+    used by get_tracks. Only tracks whose details had to be fetched separately
+    are stored; most responses carry them already.
+    """
+    return DiskCache(table='catalog', ttl=ttl_days * 86400, max_entries=max_entries)
+
+def open_tag_index(max_entries=TAG_INDEX_MAX_ENTRIES):
+    """
+    Open the persistent index of audio file tags used by parse_audio_folder.
+    Entries don't expire; files that are gone are removed when their folder is
+    scanned, and the least recently scanned ones when the index is full.
+    """
+    return DiskCache(table='tags', max_entries=max_entries)
+
+def clean_seed(artist, title):
+    """
+    Strip the noise that tags and file names often carry: track numbers,
+    "feat." credits and remaster/live/edit suffixes. A file name like
+    '01 - Artist - Title' that was split at the wrong dash is split again.
+    """
+    artist = ARTIST_NUMBER_PATTERN.sub('', artist).strip()
+    if (not artist or artist.isdigit()) and ' - ' in title:
+        artist, title = title.split(' - ', 1)
+    title = TRACK_NUMBER_PATTERN.sub('', title)
+    artist = FEAT_PATTERN.sub('', artist).strip()
+    title = FEAT_PATTERN.sub('', title)
+    title = VERSION_PATTERN.sub('', title)
+    title = DASH_VERSION_PATTERN.sub('', title).strip()
+    return artist or 'unknown artist', title or 'unknown title'
+
+def normalize_text(text):
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = text.casefold().replace('&', ' and ')
+    return ' '.join(NON_WORD_PATTERN.sub(' ', text).split())
+
+def search_cache_key(artist, title):
+    """Normalize an artist/title pair into a cache key."""
+    artist, title = clean_seed(artist, title)
+    return f'{normalize_text(artist)}\x1f{normalize_text(title)}'
+
+def match_score(artist, title, candidate_artists, candidate_title):
+    """
+    Return how well a candidate matches a normalized artist and title, from 0 to 1.
+    The title counts more than the artist; an unknown artist is ignored, but a
+    known one that isn't similar to any of the candidate's artists scores 0.
+    Names that differ in their numbers ("Song 2" and "Song 12") never match.
+    """
+    def similarity(a, b):
+        if NUMBER_PATTERN.findall(a) != NUMBER_PATTERN.findall(b):
+            return 0.0
+        return difflib.SequenceMatcher(None, a, b).ratio()
+
+    title_score = similarity(title, candidate_title)
+    if artist == 'unknown artist':
+        return title_score
+    # Tags often list every artist in one field, so compare with all of them together too
+    names = list(candidate_artists) + ([' '.join(candidate_artists)] if len(candidate_artists) > 1 else [])
+    artist_score = max((similarity(artist, name) for name in names), default=0.0)
+    if artist_score < ARTIST_MATCH_THRESHOLD:
+        return 0.0
+    return 0.4 * artist_score + 0.6 * title_score
+
+def track_names(track):
+    """Return the normalized artist names and cleaned-up title of a Spotify track."""
+    artists = [normalize_text(artist['name']) for artist in track['artists']]
+    title = clean_seed(track['artists'][0]['name'] if track['artists'] else '', track['name'])[1]
+    return artists, normalize_text(title)
+
+class TrackIndex:
+    """
+    A local inverted index of every track resolved so far, persisted in the
+    cache database. Lets search_track find seeds by fuzzy artist/title matching
+    without asking Spotify.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.entries = None
+        self.exact = {}
+        self.postings = defaultdict(set)
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = {}
+            for track_id, (artists, title) in self.cache.items():
+                self._add(track_id, artists, title)
+
+    def _add(self, track_id, artists, title):
+        self.entries[track_id] = (artists, title)
+        for artist in artists:
+            self.exact[(artist, title)] = track_id
+        for token in set(' '.join(artists + [title]).split()):
+            self.postings[token].add(track_id)
+
+    def lookup(self, artist, title):
+        """Return the ID of the best indexed match for a normalized artist and title, or None."""
+        with self.lock:
+            self._load()
+            track_id = self.exact.get((artist, title))
+            if track_id is not None:
+                return track_id
+            tokens = set(title.split())
+            if artist != 'unknown artist':
+                tokens |= set(artist.split())
+            # Tokens shared by a large part of the library ("the", "love") say little
+            # and would make every lookup scan most of the index
+            common = max(100, len(self.entries) // 20)
+            overlap = Counter()
+            for token in tokens:
+                postings = self.postings.get(token, ())
+                if len(postings) <= common:
+                    overlap.update(postings)
+            best_id, best_score = None, 0.0
+            for candidate_id, _ in overlap.most_common(20):
+                artists, candidate_title = self.entries[candidate_id]
+                score = match_score(artist, title, artists, candidate_title)
+                if score > best_score:
+                    best_id, best_score = candidate_id, score
+        return best_id if best_score >= INDEX_MATCH_THRESHOLD else None
+
+    def add(self, track):
+        """Index a Spotify track object."""
+        artists, title = track_names(track)
+        with self.lock:
+            self._load()
+            if track['id'] not in self.entries:
+                self._add(track['id'], artists, title)
+                self.cache.set(track['id'], [artists, title])
+
+def open_track_index(max_entries=SEARCH_CACHE_MAX_ENTRIES):
+    """
+    Open the index of resolved tracks used by search_track. It holds about one
+    entry per cached search, so it's capped like the search cache; the tracks
+    indexed longest ago are evicted first.
+    """
+    return TrackIndex(DiskCache(table='track_index', max_entries=max_entries))
+
+class Metrics:
+    """
+    Collects call counts, latency histograms, bytes transferred, retries and
+    sleep time for every Spotify endpoint, plus the duration of pipeline stages.
+    """
+    LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.calls = Counter()
+        self.errors = Counter()
+        self.retries = Counter()
+        self.latency_sum = Counter()
+        self.latency_max = Counter()
+        self.latency_buckets = defaultdict(lambda: [0] * (len(self.LATENCY_BUCKETS) + 1))
+        self.bytes_sent = Counter()
+        self.bytes_received = Counter()
+        self.sleep_seconds = Counter()
+        self.stage_seconds = Counter()
+        self.adapters = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def record_call(self, endpoint, seconds, error=False):
+        with self.lock:
+            self.calls[endpoint] += 1
+            if error:
+                self.errors[endpoint] += 1
+            self.latency_sum[endpoint] += seconds
+            self.latency_max[endpoint] = max(self.latency_max[endpoint], seconds)
+            buckets = self.latency_buckets[endpoint]
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+
+    def record_retry(self, endpoint):
+        with self.lock:
+            self.retries[endpoint] += 1
+
+    def record_sleep(self, reason, seconds):
+        with self.lock:
+            self.sleep_seconds[reason] += seconds
+
+    def record_response(self, response, *args, **kwargs):
+        """requests response hook counting the bytes of each Spotify request."""
+        endpoint = getattr(self.local, 'endpoint', None) or 'other'
+        body = response.request.body or b''
+        # Content-Length is the size on the wire, before gzip decoding
+        received = response.headers.get('Content-Length')
+        received = int(received) if received and received.isdigit() else len(response.content)
+        with self.lock:
+            self.bytes_sent[endpoint] += len(response.request.url) + len(body)
+            self.bytes_received[endpoint] += received
+
+    def watch_pools(self, adapter):
+        """Report the connection reuse of a requests adapter's urllib3 pools."""
+        with self.lock:
+            self.adapters.append(adapter)
+
+    def connection_stats(self):
+        """Return the connections opened and requests sent per host by the watched pools."""
+        with self.lock:
+            adapters = list(self.adapters)
+        hosts = {}
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = hosts.setdefault(f'{pool.scheme}://{pool.host}', {'connections': 0, 'requests': 0})
+                host['connections'] += pool.num_connections
+                host['requests'] += pool.num_requests
+        for host in hosts.values():
+            host['requests_per_connection'] = (round(host['requests'] / host['connections'], 2)
+                                               if host['connections'] else 0)
+        return hosts
+
+    @contextmanager
+    def endpoint(self, name):
+        """Attribute the HTTP traffic of this thread to the named endpoint."""
+        self.local.endpoint = name
+        try:
+            yield
+        finally:
+            self.local.endpoint = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stage_seconds[name] += time.monotonic() - started
+
+    def to_dict(self):
+        """Return all measurements as a JSON-serializable dict."""
+        connections = self.connection_stats()
+        with self.lock:
+            endpoints = {}
+            for endpoint in sorted(self.calls):
+                endpoints[endpoint] = {
+                    'calls': self.calls[endpoint],
+                    'errors': self.errors[endpoint],
+                    'retries': self.retries[endpoint],
+                    'latency_seconds_sum': round(self.latency_sum[endpoint], 6),
+                    'latency_seconds_max': round(self.latency_max[endpoint], 6),
+                    'latency_buckets': dict(zip([str(b) for b in self.LATENCY_BUCKETS] + ['+Inf'],
+                                                self.latency_buckets[endpoint])),
+                    'bytes_sent': self.bytes_sent[endpoint],
+                    'bytes_received': self.bytes_received[endpoint],
+                }
+            return {
+                'endpoints': endpoints,
+                'sleep_seconds': {reason: round(seconds, 6) for reason, seconds in self.sleep_seconds.items()},
+                'stage_seconds': {stage: round(seconds, 6) for stage, seconds in self.stage_seconds.items()},
+                'connections': connections,
+            }
+
+    def to_prometheus(self):
+        """Return all measurements in the Prometheus text exposition format."""
+        data = self.to_dict()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        endpoints = data['endpoints']
+        metric('seedify_api_requests_total', 'counter', 'Spotify API calls by endpoint.',
+               [({'endpoint': e}, v['calls']) for e, v in endpoints.items()])
+        metric('seedify_api_errors_total', 'counter', 'Spotify API calls that raised an error.',
+               [({'endpoint': e}, v['errors']) for e, v in endpoints.items()])
+        metric('seedify_api_retries_total', 'counter', 'Spotify API calls retried after a 429 response.',
+               [({'endpoint': e}, v['retries']) for e, v in endpoints.items()])
+        histogram = []
+        for e, v in endpoints.items():
+            cumulative = 0
+            for bound, count in v['latency_buckets'].items():
+                cumulative += count
+                histogram.append(({'endpoint': e, 'le': bound}, cumulative))
+        lines.append('# HELP seedify_api_request_duration_seconds Spotify API call latency.')
+        lines.append('# TYPE seedify_api_request_duration_seconds histogram')
+        for labels, value in histogram:
+            lines.append(f'seedify_api_request_duration_seconds_bucket{{endpoint="{labels["endpoint"]}",le="{labels["le"]}"}} {value}')
+        for e, v in endpoints.items():
+            lines.append(f'seedify_api_request_duration_seconds_sum{{endpoint="{e}"}} {v["latency_seconds_sum"]}')
+            lines.append(f'seedify_api_request_duration_seconds_count{{endpoint="{e}"}} {v["calls"]}')
+        metric('seedify_api_sent_bytes_total', 'counter', 'Bytes sent to the Spotify API.',
+               [({'endpoint': e}, v['bytes_sent']) for e, v in endpoints.items()])
+        metric('seedify_api_received_bytes_total', 'counter', 'Bytes received from the Spotify API.',
+               [({'endpoint': e}, v['bytes_received']) for e, v in endpoints.items()])
+        metric('seedify_sleep_seconds_total', 'counter', 'Time spent waiting, by reason.',
+               [({'reason': r}, v) for r, v in data['sleep_seconds'].items()])
+        metric('seedify_stage_seconds_total', 'counter', 'Time spent in each pipeline stage.',
+               [({'stage': s}, v) for s, v in data['stage_seconds'].items()])
+        metric('seedify_http_connections_opened_total', 'counter', 'HTTP connections opened, by host.',
+               [({'host': h}, v['connections']) for h, v in data['connections'].items()])
+        metric('seedify_http_requests_total', 'counter', 'HTTP requests sent over pooled connections, by host.',
+               [({'host': h}, v['requests']) for h, v in data['connections'].items()])
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        """Return a human-readable summary of the measurements."""
+        data = self.to_dict()
+        lines = ["Pipeline stages:"]
+        for stage, seconds in data['stage_seconds'].items():
+            lines.append(f"  {stage:<24} {seconds:9.3f}s")
+        lines.append("Spotify API calls:")
+        lines.append(f"  {'endpoint':<24} {'calls':>6} {'errors':>6} {'retries':>7} {'total':>9} {'avg':>8} {'max':>8} {'KiB in':>9}")
+        for endpoint, v in data['endpoints'].items():
+            avg = v['latency_seconds_sum'] / v['calls'] if v['calls'] else 0
+            lines.append(f"  {endpoint:<24} {v['calls']:>6} {v['errors']:>6} {v['retries']:>7} "
+                         f"{v['latency_seconds_sum']:>8.3f}s {avg:>7.3f}s {v['latency_seconds_max']:>7.3f}s "
+                         f"{v['bytes_received'] / 1024:>9.1f}")
+        lines.append("Time spent sleeping:")
+        for reason, seconds in data['sleep_seconds'].items():
+            lines.append(f"  {reason:<24} {seconds:9.3f}s")
+        lines.append("HTTP connections:")
+        lines.append(f"  {'host':<32} {'opened':>6} {'requests':>8} {'per conn':>8}")
+        for host, v in data['connections'].items():
+            lines.append(f"  {host:<32} {v['connections']:>6} {v['requests']:>8} {v['requests_per_connection']:>8}")
+        return '\n'.join(lines)
+
+metrics = Metrics()
+
+def write_file_atomically(path, content):
+    """Write a file via a temporary file so scrapers never see a partial one."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+class RateLimiter:
+    """
+    A token bucket shared by every Spotify call.
+    The rate is halved whenever Spotify answers 429 and all callers pause for
+    the Retry-After period; it then recovers gradually towards max_rate.
+    The rate never drops below min_rate, unless max_rate is lower still.
+    A Retry-After longer than MAX_RETRY_AFTER isn't waited out; the call fails.
+    """
+
+    def __init__(self, max_rate=DEFAULT_MAX_RATE, min_rate=0.5, max_retries=MAX_RETRIES):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.max_retries = max_retries
+        self.rate = max_rate
+        self.tokens = max_rate
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def configure(self, max_rate):
+        """Change the maximum request rate."""
+        with self.lock:
+            self.max_rate = max_rate
+            self.rate = max_rate
+            self.tokens = min(self.tokens, max_rate)
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # Allow bursts of up to one second's worth of requests
+                capacity = max(1.0, self.rate)
+                self.tokens = min(capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.blocked_until > now:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
                 else:
-                    # Handle cases where the format is different
-                    title_info = info.split(',', 1)[-1]
-                    if ' - ' in title_info:
-                        artist, title = title_info.split(' - ', 1)
-                        artist = artist.strip()
-                        title = title.strip()
-                    else:
-                        # If format is unknown, set artist and title as unknown
-                        artist = 'unknown artist'
-                        title = 'unknown title'
-
-                # Check for unknown artist and title
-                if artist.lower() == 'unknown artist' and title.lower() == 'unknown title':
-                    # Try to use filename
-                    i += 1  # Move to the next line which should be the file path
-                    if i < len(lines):
-                        file_line = lines[i].strip()
-                        filename = os.path.basename(file_line)
-                        # Remove file extension
-                        filename_no_ext = os.path.splitext(filename)[0]
-                        # Try to split filename into artist and title
-                        if ' - ' in filename_no_ext:
-                            artist, title = filename_no_ext.split(' - ', 1)
-                        else:
-                            title = filename_no_ext
-                            artist = 'unknown artist'
-                tracks.append({'artist': artist.strip(), 'title': title.strip()})
-            i += 1
-    return tracks
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            metrics.record_sleep('rate limit', wait)
+
+    def on_success(self):
+        """Additively increase the rate after a successful request."""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+    def on_throttled(self, retry_after):
+        """Halve the rate and pause every caller for retry_after seconds."""
+        with self.lock:
+            self.rate = max(min(self.min_rate, self.max_rate), self.rate / 2)
+            self.tokens = min(self.tokens, max(1.0, self.rate))
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def call(self, fn, *args, **kwargs):
+        """Call fn through the limiter, retrying with jittered backoff on 429."""
+        endpoint = getattr(fn, '__name__', 'other')
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            started = time.monotonic()
+            try:
+                with metrics.endpoint(endpoint):
+                    result = fn(*args, **kwargs)
+            except spotipy.exceptions.SpotifyException as e:
+                metrics.record_call(endpoint, time.monotonic() - started, error=True)
+                # spotipy reports urllib3's exhausted retries as a 429 without headers;
+                # only a real 429 response means Spotify is throttling
+                if e.http_status != 429 or not e.headers or attempt == self.max_retries:
+                    raise
+                retry_after = retry_after_seconds(e)
+                if retry_after is None:
+                    retry_after = min(30, 2 ** attempt)
+                elif retry_after > MAX_RETRY_AFTER:
+                    print(f"Spotify asked to wait {retry_after:.0f} seconds before retrying, giving up.")
+                    raise
+                self.on_throttled(retry_after)
+                metrics.record_retry(endpoint)
+                # Spread the retries so waiting threads don't all fire at once
+                delay = retry_after + random.uniform(0, 0.5)
+                time.sleep(delay)
+                metrics.record_sleep('retry after 429', delay)
+                continue
+            metrics.record_call(endpoint, time.monotonic() - started)
+            self.on_success()
+            return result
+
+def retry_after_seconds(error):
+    """Return the Retry-After delay of a SpotifyException, if it has one."""
+    value = (error.headers or {}).get('Retry-After')
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+rate_limiter = RateLimiter()
+
+def spotify_call(fn, *args, **kwargs):
+    """Call a Spotify client method through the shared rate limiter."""
+    return rate_limiter.call(fn, *args, **kwargs)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls: threads asking for a key that is already being
+    computed wait for that result instead of repeating the work. If ttl is set,
+    results are also kept for ttl seconds (up to max_entries of them).
+    """
+
+    def __init__(self, ttl=0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.results = {}
+
+    def configure(self, ttl, max_entries=None):
+        with self.lock:
+            self.ttl = ttl
+            if max_entries is not None:
+                self.max_entries = max_entries
+            self.results.clear()
+
+    def do(self, key, fn, remember=None):
+        """
+        Return fn() for key, sharing the call with concurrent callers of the same key.
+        remember, if given, decides whether a result may be kept for later callers.
+        """
+        with self.lock:
+            kept = self.results.get(key)
+            if kept is not None and time.monotonic() - kept[0] <= self.ttl:
+                return kept[1]
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            with self.lock:
+                del self.calls[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.calls[key]
+            if remember is None or remember(result):
+                self._keep(key, result)
+        future.set_result(result)
+        return result
+
+    def keep(self, key, result):
+        """Keep a result computed outside do() for later callers of key."""
+        with self.lock:
+            self._keep(key, result)
+
+    def _keep(self, key, result):
+        if self.ttl:
+            self.results.pop(key, None)
+            self.results[key] = (time.monotonic(), result)
+            while len(self.results) > self.max_entries:
+                del self.results[next(iter(self.results))]
+
+recommendation_flights = SingleFlight()
+# Seed lookups are only shared while in flight; the search cache keeps the results
+search_flights = SingleFlight()
+
+def build_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Build the HTTP session shared by the Spotify client and its auth manager.
+    Server errors are retried by urllib3, but 429 responses are passed through
+    to the rate limiter. Up to pool_size kept-alive connections per host are
+    reused; when all are busy, callers wait for one instead of opening a
+    connection that would be thrown away afterwards.
+    """
+    import requests
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        respect_retry_after_header=False,
+        # Hand the last 5xx response to spotipy instead of raising RetryError
+        raise_on_status=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    session.hooks['response'].append(metrics.record_response)
+    metrics.watch_pools(adapter)
+    return session
+
+class TrackRecord:
+    """
+    The parts of a Spotify track object the pipeline uses, in a slotted record
+    with interned IDs and artist names; a fraction of the size of the JSON.
+    release_year is None for simplified tracks received without their album.
+    """
+    __slots__ = ('id', 'name', 'artist_ids', 'artist_names', 'release_year', 'popularity', 'duration_ms', 'explicit')
+
+    def __init__(self, id, name, artist_ids, artist_names, release_year=None, popularity=None, duration_ms=None,
+                 explicit=None):
+        self.id = sys.intern(id)
+        self.name = name
+        self.artist_ids = tuple(sys.intern(artist_id) for artist_id in artist_ids)
+        self.artist_names = tuple(sys.intern(artist_name) for artist_name in artist_names)
+        self.release_year = release_year
+        self.popularity = popularity
+        self.duration_ms = duration_ms
+        self.explicit = explicit
+
+    @classmethod
+    def from_json(cls, track):
+        """Build a record from a full or simplified Spotify track object."""
+        release_date = (track.get('album') or {}).get('release_date')
+        return cls(track['id'], track['name'],
+                   [artist['id'] for artist in track['artists']],
+                   [artist['name'] for artist in track['artists']],
+                   int(release_date.split('-')[0]) if release_date else None,
+                   track.get('popularity'), track.get('duration_ms'), track.get('explicit'))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class TrackStore:
+    """
+    Keeps every track and artist received from Spotify during a run, so each
+    is fetched at most once, and counts the API calls saved. Tracks are kept
+    as TrackRecords, one per ID. Audio features are kept as rows of one NumPy
+    matrix, with feature_rows mapping each track ID to its row.
+    """
+
+    def __init__(self):
+        self.tracks = {}
+        self.artists = {}
+        # Row 0 is all NaN and stands for tracks Spotify has no features for.
+        # The matrix is allocated with the first features, so it needs NumPy only when ranking.
+        self.features = None
+        self.feature_rows = {}
+        self.feature_count = 1
+        self.calls_saved = Counter()
+        self.lock = threading.Lock()
+
+    def add_tracks(self, tracks):
+        """
+        Remember track objects or records, preferring ones with album data.
+        Returns the stored record of each track, so a track seen twice shares one record.
+        """
+        stored = []
+        with self.lock:
+            for track in tracks:
+                if isinstance(track, dict):
+                    if not track.get('id'):
+                        continue
+                    track = TrackRecord.from_json(track)
+                elif track is None:
+                    continue
+                known = self.tracks.get(track.id)
+                if known is None or (known.release_year is None and track.release_year is not None):
+                    self.tracks[track.id] = known = track
+                stored.append(known)
+        return stored
+
+    def add_artists(self, artists):
+        """Remember full artist objects."""
+        with self.lock:
+            for artist in artists:
+                if artist and artist.get('id'):
+                    self.artists[artist['id']] = artist
+
+    def add_features(self, track_ids, features):
+        """
+        Append the ranking features of the given tracks to the feature matrix,
+        with tempo scaled and popularity (0-1) as the last column. None marks
+        tracks Spotify has no features for.
+        """
+        width = len(RANKING_FEATURES) + 1
+        values = np.full((len(track_ids), width), np.nan)
+        for row, (track_id, feature) in enumerate(zip(track_ids, features)):
+            if feature:
+                values[row, :-1] = [float(feature.get(name, 'nan')) for name in RANKING_FEATURES]
+                track = self.tracks.get(track_id)
+                if track is not None and track.popularity is not None:
+                    values[row, -1] = track.popularity
+        values[:, RANKING_FEATURES.index('tempo')] /= TEMPO_SCALE
+        values[:, -1] /= 100
+        with self.lock:
+            start = self.feature_count
+            end = start + len(track_ids)
+            if self.features is None:
+                self.features = np.full((max(end, 1024), width), np.nan)
+            elif end > len(self.features):
+                grown = np.full((max(end, 2 * len(self.features)), width), np.nan)
+                grown[:start] = self.features[:start]
+                self.features = grown
+            self.features[start:end] = values
+            self.feature_count = end
+            for row, (track_id, feature) in enumerate(zip(track_ids, features), start):
+                self.feature_rows[track_id] = row if feature else 0
+
+    def feature_matrix(self, track_ids):
+        """
+        Return the N x F matrix of the ranking features of the given tracks,
+        gathered from the feature matrix in one indexing operation. Unknown values are NaN.
+        """
+        with self.lock:
+            rows = np.fromiter((self.feature_rows.get(track_id, 0) for track_id in track_ids), dtype=np.intp,
+                               count=len(track_ids))
+            if self.features is None:
+                return np.full((len(track_ids), len(RANKING_FEATURES) + 1), np.nan)
+            return self.features[rows]
+
+    def get_track(self, track_id):
+        return self.tracks.get(track_id)
+
+    def get_artist(self, artist_id):
+        return self.artists.get(artist_id)
+
+    def saved(self, endpoint, calls=1):
+        """Record that `calls` requests to endpoint were avoided."""
+        if calls > 0:
+            with self.lock:
+                self.calls_saved[endpoint] += calls
+
+    def report(self):
+        """Print how many API calls were avoided by reusing stored objects."""
+        total = sum(self.calls_saved.values())
+        if not total:
+            return
+        details = ', '.join(f"{endpoint}: {count}" for endpoint, count in self.calls_saved.most_common())
+        print(f"\nReused Spotify data already fetched in this run, saving {total} API calls ({details}).")
+
+def batch_count(items, batch_size):
+    """Return the number of requests needed to send items in batches of batch_size."""
+    return -(-len(items) // batch_size)
+
+def bounded_map(fn, iterable, max_workers):
+    """
+    Apply fn to every item using a pool of max_workers threads and yield the
+    results in input order. At most 2 * max_workers items are in flight, so the
+    input is consumed lazily and closing the generator cancels the rest.
+    """
+    if max_workers <= 1:
+        for item in iterable:
+            yield fn(item)
+        return
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def decode_playlist_line(raw):
+    """Decode a playlist line as UTF-8, falling back to Windows-1252."""
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('cp1252', errors='replace')
+
+def iter_m3u_entries(file_path):
+    """
+    Read an M3U/M3U8 playlist line by line and yield (info, location) pairs,
+    where info is the text after '#EXTINF:' (or None) and location is the
+    entry's path or URL (or None if the playlist ends first).
+    """
+    with open(file_path, 'rb') as file:
+        yield from iter_m3u_lines(file)
+
+def iter_m3u_lines(lines):
+    """Yield the (info, location) pairs of an M3U playlist given as raw lines (bytes)."""
+    info = None
+    for raw in lines:
+        line = decode_playlist_line(raw).lstrip('\ufeff').strip()
+        if not line:
+            continue
+        if line.startswith('#EXTINF:'):
+            if info is not None:
+                yield info, None
+            info = line[len('#EXTINF:'):]
+        elif line.startswith('#'):
+            continue
+        else:
+            yield info, line
+            info = None
+    if info is not None:
+        yield info, None
+
+def resolve_playlist_location(location, playlist_dir):
+    """Turn a playlist entry into a local path, resolving relative paths against the playlist's folder."""
+    if location.startswith('file://'):
+        return unquote(urlparse(location).path)
+    if '://' in location:
+        return location  # Remote stream, keep as is
+    location = location.replace('\\', os.sep) if os.sep == '/' else location
+    if not os.path.isabs(location):
+        location = os.path.join(playlist_dir, location)
+    return os.path.normpath(location)
+
+def track_from_filename(path):
+    """Guess artist and title from a file name like 'Artist - Title.mp3'."""
+    filename = os.path.basename(unquote(path).rstrip('/'))
+    # Remove file extension
+    filename_no_ext = os.path.splitext(filename)[0]
+    # Try to split filename into artist and title
+    if ' - ' in filename_no_ext:
+        artist, title = filename_no_ext.split(' - ', 1)
+    else:
+        title = filename_no_ext
+        artist = 'unknown artist'
+    return {'artist': artist.strip(), 'title': title.strip()}
+
+def parse_m3u(file_path):
+    """
+    Parse an M3U/M3U8 playlist file and yield track information one entry at a time.
+    Entries without usable #EXTINF information fall back to the audio file's tags
+    if the file can be found, and otherwise to its file name.
+    """
+    playlist_dir = os.path.dirname(os.path.abspath(file_path))
+    yield from parse_m3u_entries(iter_m3u_entries(file_path), playlist_dir)
+
+def parse_m3u_entries(entries, playlist_dir):
+    """
+    Turn (info, location) pairs into track information; see parse_m3u.
+    With playlist_dir None the files aren't looked for, and entries without
+    #EXTINF information are named after their file.
+    """
+    for info, location in entries:
+        artist = 'unknown artist'
+        title = 'unknown title'
+        if info is not None:
+            # Extract artist and title
+            match = EXTINF_PATTERN.match(info)
+            if match:
+                artist = match.group(1).strip()
+                title = match.group(2).strip()
+            else:
+                # Handle cases where the format is different
+                title_info = info.split(',', 1)[-1]
+                if ' - ' in title_info:
+                    artist, title = title_info.split(' - ', 1)
+                    artist = artist.strip()
+                    title = title.strip()
+
+        # Check for unknown artist and title
+        if artist.lower() == 'unknown artist' and title.lower() == 'unknown title' and location:
+            if playlist_dir is None:
+                yield track_from_filename(location.replace('\\', '/'))
+                continue
+            path = resolve_playlist_location(location, playlist_dir)
+            track = None
+            if os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS and os.path.isfile(path):
+                track = parse_audio_file(path)
+            if not track or (track['artist'] == 'unknown artist' and track['title'] == 'unknown title'):
+                # Try to use filename
+                track = track_from_filename(path)
+            yield track
+        else:
+            yield {'artist': artist.strip(), 'title': title.strip()}
+
+class M3UPlaylist:
+    """
+    A lazily parsed playlist. Iterating it streams the file from disk, and
+    len() counts its entries without keeping them in memory.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._length = None
+
+    def __iter__(self):
+        return parse_m3u(self.file_path)
+
+    def __len__(self):
+        if self._length is None:
+            self._length = sum(1 for _ in iter_m3u_entries(self.file_path))
+        return self._length
 
 def parse_audio_file(file_path):
     """Extract artist and title from an audio file's metadata."""
+    # Imported here, so playlists that never touch an audio file don't load mutagen
+    from mutagen import File as MutagenFile
+
     try:
         audio = MutagenFile(file_path, easy=True)
         if audio is None:
@@ -100,184 +1122,480 @@ def parse_audio_file(file_path):
         print(f"Error reading {file_path}: {e}")
         return None
 
-def parse_audio_folder(folder_path):
-    """Recursively parse a folder to extract track information from audio files."""
-    supported_extensions = ['.mp3', '.flac', '.wav', '.m4a', '.aac', '.ogg']
-    tracks = []
+def parse_audio_folder(folder_path, tag_index=None, workers=DEFAULT_WORKERS):
+    """
+    Recursively parse a folder to extract track information from audio files.
+    If a tag index is given, only files that are new or whose modification time
+    or size changed since the last scan are opened; their tags are read by up to
+    `workers` threads and stored back in the index. Indexed files under the
+    folder that no longer exist are removed from the index.
+    """
+    files_found = []
     for root, dirs, files in os.walk(folder_path):
         for file in files:
-            if os.path.splitext(file)[1].lower() in supported_extensions:
-                file_path = os.path.join(root, file)
-                track_info = parse_audio_file(file_path)
-                if track_info:
-                    tracks.append(track_info)
-    return tracks
-
-def search_track(sp, artist, title):
-    """Search for a track on Spotify and return its ID."""
-    query = f'artist:{artist} track:{title}'
-    try:
-        result = sp.search(q=query, type='track', limit=1)
-        tracks = result['tracks']['items']
-        if tracks:
-            return tracks[0]['id']
+            if os.path.splitext(file)[1].lower() in AUDIO_EXTENSIONS:
+                file_path = os.path.abspath(os.path.join(root, file))
+                try:
+                    stat = os.stat(file_path)
+                except OSError as e:
+                    print(f"Error reading {file_path}: {e}")
+                    continue
+                files_found.append((file_path, stat.st_mtime_ns, stat.st_size))
+
+    indexed = tag_index.get_many(path for path, _, _ in files_found) if tag_index is not None else {}
+    results = {}
+    to_read = []
+    for file_path, mtime, size in files_found:
+        entry = indexed.get(file_path)
+        if entry is not None and entry['mtime'] == mtime and entry['size'] == size:
+            results[file_path] = entry['track']
+        else:
+            to_read.append((file_path, mtime, size))
+
+    if to_read:
+        print(f"Reading tags of {len(to_read)} new or changed files...")
+        updates = []
+        read_tags = bounded_map(parse_audio_file, (file_path for file_path, _, _ in to_read), workers)
+        for (file_path, mtime, size), track_info in zip(to_read, read_tags):
+            results[file_path] = track_info
+            # Unreadable files are indexed too, so they're skipped until they change
+            updates.append((file_path, {'mtime': mtime, 'size': size, 'track': track_info}))
+            if tag_index is not None and len(updates) >= 1000:
+                tag_index.set_many(updates)
+                updates = []
+        if tag_index is not None and updates:
+            tag_index.set_many(updates)
+
+    if tag_index is not None:
+        # Forget files deleted or moved away since the last scan of this folder
+        prefix = os.path.join(os.path.abspath(folder_path), '')
+        stale = [file_path for file_path in tag_index.keys(prefix) if file_path not in results]
+        if stale:
+            tag_index.delete_many(stale)
+
+    return [results[file_path] for file_path, _, _ in files_found if results[file_path]]
+
+def search_track(sp, artist, title, cache=None, store=None, index=None):
+    """
+    Search for a track on Spotify and return its ID.
+    Artist and title are cleaned up first. If a cache is given, previous results
+    (including misses) are reused and new results are stored in it. If an index
+    is given, it's searched for a close match before asking Spotify. Spotify is
+    asked for several candidates, which are ranked by similarity; if the strict
+    artist/track query finds nothing, a plain keyword query is tried.
+    Found tracks are added to the store and the index.
+    """
+    artist, title = clean_seed(artist, title)
+    key = search_cache_key(artist, title)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not DiskCache.MISSING:
+            return cached
+    norm_artist, norm_title = normalize_text(artist), normalize_text(title)
+    if index is not None:
+        track_id = index.lookup(norm_artist, norm_title)
+        if track_id is not None:
+            if cache is not None:
+                cache.set(key, track_id)
+            return track_id
+    def search():
+        if artist == 'unknown artist':
+            queries = [f'track:{title}']
         else:
+            queries = [f'artist:{artist} track:{title}', f'{artist} {title}']
+        track_id = None
+        try:
+            for query in queries:
+                result = spotify_call(sp.search, q=query, type='track', limit=SEARCH_CANDIDATES)
+                tracks = [track for track in result['tracks']['items'] if track]
+                if store is not None:
+                    store.add_tracks(tracks)
+                best_score = 0.0
+                for track in tracks:
+                    score = match_score(norm_artist, norm_title, *track_names(track))
+                    if score > best_score:
+                        best, best_score = track, score
+                if best_score >= SEARCH_MATCH_THRESHOLD:
+                    track_id = best['id']
+                    if index is not None:
+                        index.add(best)
+                    break
+        except spotipy.exceptions.SpotifyException as e:
+            print(f"Error searching for track '{artist} - {title}': {e}")
+            # Don't cache errors, only definitive answers
             return None
-    except spotipy.exceptions.SpotifyException as e:
-        print(f"Error searching for track '{artist} - {title}': {e}")
-        return None
+        if cache is not None:
+            cache.set(key, track_id)
+        return track_id
 
-def get_recommendations(sp, seed_tracks, additional_params):
+    # Concurrent lookups of the same seed share one search
+    return search_flights.do(key, search)
+
+def get_recommendations(sp, seed_tracks, additional_params, workers=1, store=None, limit=MAX_RECOMMENDATIONS):
     """
-    Get track recommendations from Spotify based on seed tracks and additional parameters.
-    Ensures that no more than 5 seed tracks are used per API call.
+    Get track recommendations from Spotify based on seed tracks and additional parameters,
+    as TrackRecords.
+    Ensures that no more than 5 seed tracks are used per API call, each asking for `limit` tracks.
+    Batches are fetched by up to `workers` threads and returned in seed order.
+    Concurrent requests for the same seeds and criteria share one API call,
+    whatever their limits. When results are kept for later requests (server
+    mode), the full 100 tracks are fetched once and each caller takes its
+    limit; otherwise a caller that needs more than a shared call asked for
+    fetches them separately. The recommended tracks are added to the store.
     """
     all_recommendations = []
-    # Spotify allows a maximum of 5 seeds (tracks, artists, genres)
-    # We'll batch seed_tracks into groups of 5
-    max_seeds = 5
-    seed_batches = [seed_tracks[i:i + max_seeds] for i in range(0, len(seed_tracks), max_seeds)]
-    
-    for batch in seed_batches:
+    seed_batches = [seed_tracks[i:i + MAX_SEEDS] for i in range(0, len(seed_tracks), MAX_SEEDS)]
+
+    def fetch(batch):
+        fetch_limit = MAX_RECOMMENDATIONS if recommendation_flights.ttl else limit
+
+        def request():
+            tracks = spotify_call(sp.recommendations, seed_tracks=batch, limit=fetch_limit,
+                                  **additional_params)['tracks']
+            return fetch_limit, [TrackRecord.from_json(track) for track in tracks if track]
+
+        # The limit isn't part of the key, so requests for playlists of different lengths share a call
+        key = json.dumps([batch, additional_params], sort_keys=True)
         try:
-            recommendations = sp.recommendations(seed_tracks=batch, limit=100, **additional_params)
-            all_recommendations.extend(recommendations['tracks'])
-            # To avoid hitting rate limits
-            time.sleep(0.1)
+            fetched_limit, tracks = recommendation_flights.do(key, request, remember=lambda result: bool(result[1]))
+            # Spotify returning fewer tracks than asked for means there are no more
+            if fetched_limit < limit and len(tracks) >= fetched_limit:
+                fetch_limit = limit
+                fetched_limit, tracks = request()
+                if tracks:
+                    recommendation_flights.keep(key, (fetched_limit, tracks))
         except spotipy.exceptions.SpotifyException as e:
             print(f"Error fetching recommendations with seeds {batch}: {e}")
-            continue
+            return []
+        tracks = tracks[:limit]
+        if store is not None:
+            tracks = store.add_tracks(tracks)
+        return tracks
+
+    for recommendations in bounded_map(fetch, seed_batches, workers):
+        all_recommendations.extend(recommendations)
     return all_recommendations
 
+def schedule_seed_batches(seed_artists):
+    """
+    Pack seed tracks into batches of up to 5 for one recommendations request each.
+    seed_artists maps seed track IDs, in input order, to their artist. Seeds by
+    the same artist are kept together, so the seeds of a request are alike;
+    artists follow the order of their first seed.
+    """
+    by_artist = {}
+    for seed_track_id, artist in seed_artists.items():
+        by_artist.setdefault(artist, []).append(seed_track_id)
+    ordered = [seed_track_id for seeds in by_artist.values() for seed_track_id in seeds]
+    return [ordered[i:i + MAX_SEEDS] for i in range(0, len(ordered), MAX_SEEDS)]
+
+def recommendation_limit(needed, batch_size, seed_count):
+    """Return how many recommendations to request for a batch's share of the needed tracks."""
+    share = -(-needed * RECOMMENDATION_OVERFETCH * batch_size // seed_count)
+    return min(MAX_RECOMMENDATIONS, max(batch_size, share))
+
 def create_playlist(sp, user_id, name, description=''):
     """Create a new Spotify playlist."""
     try:
-        playlist = sp.user_playlist_create(user=user_id, name=name, public=False, description=description)
+        playlist = spotify_call(sp.user_playlist_create, user=user_id, name=name, public=False, description=description)
         return playlist['id']
     except spotipy.exceptions.SpotifyException as e:
         print(f"Error creating playlist '{name}': {e}")
         return None
 
-def add_tracks_to_playlist(sp, playlist_id, track_ids):
-    """Add tracks to a Spotify playlist in batches of 100."""
+def add_tracks_to_playlist(sp, playlist_id, track_ids, journal=None):
+    """
+    Add tracks to a Spotify playlist in batches of 100. Returns the number of tracks added.
+    If a journal is given, each added batch is recorded in it, and batches it
+    already records are skipped, so resuming never adds a track twice.
+    """
+    added = 0
+    for i in range(0, len(track_ids), 100):
+        if journal is not None and i in journal.batches:
+            added += len(track_ids[i:i+100])
+            continue
+        try:
+            spotify_call(sp.playlist_add_items, playlist_id, track_ids[i:i+100])
+            added += len(track_ids[i:i+100])
+        except spotipy.exceptions.SpotifyException as e:
+            print(f"Error adding tracks to playlist: {e}")
+            continue
+        if journal is not None:
+            journal.record('batch', offset=i)
+    return added
+
+def get_playlist_track_ids(sp, playlist_id):
+    """Return the IDs of the tracks in a playlist, in order, or None if it couldn't be read."""
+    track_ids = []
     try:
-        for i in range(0, len(track_ids), 100):
-            sp.playlist_add_items(playlist_id, track_ids[i:i+100])
-            # To avoid hitting rate limits
-            time.sleep(0.1)
+        page = spotify_call(sp.playlist_items, playlist_id, fields='items(track(id)),next', limit=100,
+                            additional_types=['track'])
+        while page:
+            # Local files and unavailable tracks have no ID and can't be managed through the API
+            track_ids.extend(item['track']['id'] for item in page['items'] if item.get('track') and item['track'].get('id'))
+            page = spotify_call(sp.next, page) if page.get('next') else None
     except spotipy.exceptions.SpotifyException as e:
-        print(f"Error adding tracks to playlist: {e}")
+        print(f"Error reading playlist {playlist_id}: {e}")
+        return None
+    return track_ids
+
+def remove_tracks_from_playlist(sp, playlist_id, track_ids):
+    """Remove tracks from a Spotify playlist in batches of 100. Returns the number of tracks removed."""
+    removed = 0
+    for i in range(0, len(track_ids), 100):
+        try:
+            spotify_call(sp.playlist_remove_all_occurrences_of_items, playlist_id, track_ids[i:i+100])
+            removed += len(track_ids[i:i+100])
+        except spotipy.exceptions.SpotifyException as e:
+            print(f"Error removing tracks from playlist: {e}")
+    return removed
+
+def sync_playlist(sp, playlist_id, track_ids):
+    """
+    Make an existing playlist contain exactly the given tracks, sending only the
+    difference: tracks no longer recommended are removed and new ones are appended.
+    Tracks that stay keep their position. Returns a dict with the number of tracks
+    added, removed and kept, and the numbers that should have been added and removed;
+    returns None if the playlist couldn't be read.
+    """
+    current_ids = get_playlist_track_ids(sp, playlist_id)
+    if current_ids is None:
+        return None
+    wanted = set(track_ids)
+    current = set(current_ids)
+    to_remove = [track_id for track_id in dict.fromkeys(current_ids) if track_id not in wanted]
+    to_add = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in current]
+    return {
+        'removed': remove_tracks_from_playlist(sp, playlist_id, to_remove),
+        'added': add_tracks_to_playlist(sp, playlist_id, to_add),
+        'kept': len(wanted & current),
+        'to_remove': len(to_remove),
+        'to_add': len(to_add),
+    }
 
-def get_genres(sp, artist_ids):
-    """Retrieve genres for a list of artist IDs."""
-    genres = []
+def get_genres(sp, artist_ids, store=None, cache=None):
+    """
+    Return a dict mapping each of the given artist IDs to its list of genres.
+    Artists already in the store or the cache are reused; the rest are fetched
+    in batches of 50 and added to both. Artists that couldn't be fetched are left out.
+    """
+    genres = {}
+    missing_ids = list(dict.fromkeys(artist_ids))
+    requested = missing_ids
+    if store is not None:
+        for artist_id in missing_ids:
+            artist = store.get_artist(artist_id)
+            if artist is not None:
+                genres[artist_id] = artist['genres']
+        missing_ids = [artist_id for artist_id in missing_ids if artist_id not in genres]
+    if cache is not None:
+        genres.update(cache.get_many(missing_ids))
+        missing_ids = [artist_id for artist_id in missing_ids if artist_id not in genres]
+    if store is not None:
+        store.saved('artists', batch_count(requested, 50) - batch_count(missing_ids, 50))
     # Batch the artist IDs
-    for i in range(0, len(artist_ids), 50):
-        batch_ids = artist_ids[i:i+50]
+    for i in range(0, len(missing_ids), 50):
+        batch_ids = missing_ids[i:i+50]
         try:
-            artists = sp.artists(batch_ids)['artists']
-            for artist in artists:
-                genres.extend(artist['genres'])
-            # To avoid hitting rate limits
-            time.sleep(0.1)
+            artists = [artist for artist in spotify_call(sp.artists, batch_ids)['artists'] if artist]
         except spotipy.exceptions.SpotifyException as e:
             print(f"Error fetching genres for artists {batch_ids}: {e}")
             continue
+        if store is not None:
+            store.add_artists(artists)
+        fetched = {artist['id']: artist['genres'] for artist in artists}
+        genres.update(fetched)
+        if cache is not None:
+            cache.set_many(fetched.items())
     return genres
 
-def get_input_tracks(input_path):
+def get_input_tracks(input_path, tag_index=None, workers=DEFAULT_WORKERS):
     """Determine the type of input and parse tracks accordingly."""
     if os.path.isfile(input_path):
-        if input_path.lower().endswith('.m3u'):
-            return parse_m3u(input_path)
-        elif os.path.splitext(input_path)[1].lower() in ['.mp3', '.flac', '.wav', '.m4a', '.aac', '.ogg']:
+        extension = os.path.splitext(input_path)[1].lower()
+        if extension in PLAYLIST_EXTENSIONS:
+            return M3UPlaylist(input_path)
+        elif extension in AUDIO_EXTENSIONS:
             track = parse_audio_file(input_path)
             return [track] if track else []
         else:
             print("Unsupported file type. Please provide an M3U playlist or a supported audio file.")
             return []
     elif os.path.isdir(input_path):
-        return parse_audio_folder(input_path)
+        return parse_audio_folder(input_path, tag_index, workers)
     else:
         print("Invalid input path. Please provide a valid file or directory.")
         return []
 
-def filter_tracks_by_release_year(sp, tracks, min_year=None, max_year=None):
+def get_tracks(sp, track_ids, store=None, catalog=None):
+    """
+    Return TrackRecords with album data for the given IDs, in order.
+    Tracks already in the store or the catalog are reused; only the rest are
+    fetched, in batches of 50, and added to both. Tracks that couldn't be fetched are left out.
+    """
+    found = {}
+    missing_ids = track_ids
+    if store is not None:
+        for track_id in track_ids:
+            track = store.get_track(track_id)
+            if track is not None and track.release_year is not None:
+                found[track_id] = track
+        missing_ids = [track_id for track_id in track_ids if track_id not in found]
+    if catalog is not None and missing_ids:
+        records = [TrackRecord.from_dict(data) for data in catalog.get_many(missing_ids).values()]
+        for track in (store.add_tracks(records) if store is not None else records):
+            found[track.id] = track
+        missing_ids = [track_id for track_id in missing_ids if track_id not in found]
+    if store is not None:
+        store.saved('tracks', batch_count(track_ids, 50) - batch_count(missing_ids, 50))
+    for i in range(0, len(missing_ids), 50):  # Spotify API limit
+        batch_ids = missing_ids[i:i+50]
+        try:
+            tracks_info = spotify_call(sp.tracks, batch_ids)['tracks']
+        except spotipy.exceptions.SpotifyException as e:
+            print(f"Error fetching track details: {e}")
+            continue
+        if store is not None:
+            records = store.add_tracks(tracks_info)
+        else:
+            records = [TrackRecord.from_json(track) for track in tracks_info if track]
+        if catalog is not None:
+            catalog.set_many((track.id, track.to_dict()) for track in records if track.release_year is not None)
+        for track in records:
+            found[track.id] = track
+    return [found[track_id] for track_id in track_ids if track_id in found]
+
+def get_audio_features(sp, track_ids, store, workers=1):
+    """Fetch audio features for the tracks not yet in the store, 100 per request."""
+    missing_ids = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in store.feature_rows]
+    batches = [missing_ids[i:i+100] for i in range(0, len(missing_ids), 100)]
+
+    def fetch(batch):
+        try:
+            return spotify_call(sp.audio_features, batch) or []
+        except spotipy.exceptions.SpotifyException as e:
+            print(f"Error fetching audio features: {e}")
+            return None
+
+    for batch, features in zip(batches, bounded_map(fetch, batches, workers)):
+        if features is not None:
+            store.add_features(batch, features)
+
+def score_tracks(track_ids, seed_track_ids, criteria, store):
+    """
+    Score tracks by their squared distance to the seed tracks' feature centroid
+    plus the weighted distance to the target criteria, in one vectorized pass.
+    Lower is better; tracks without audio features score infinity.
+    """
+    candidates = store.feature_matrix(track_ids)
+    scores = np.zeros(len(track_ids))
+    seeds = store.feature_matrix(seed_track_ids)[:, :-1]
+    seeds = seeds[~np.isnan(seeds).all(axis=1)]
+    if len(seeds):
+        with warnings.catch_warnings():
+            # Features none of the seeds have give a NaN centroid, which nansum skips
+            warnings.simplefilter('ignore', RuntimeWarning)
+            centroid = np.nanmean(seeds, axis=0)
+        scores += np.nansum((candidates[:, :-1] - centroid) ** 2, axis=1)
+
+    targets = {f'target_{name}': column for column, name in enumerate(RANKING_FEATURES)}
+    targets['target_popularity'] = len(RANKING_FEATURES)
+    columns = [targets[name] for name in criteria if name in targets]
+    if columns:
+        values = np.array([criteria[name] for name in criteria if name in targets], dtype=float)
+        values[np.array(columns) == len(RANKING_FEATURES)] /= 100
+        scores += TARGET_WEIGHT * np.nansum((candidates[:, columns] - values) ** 2, axis=1)
+
+    scores[np.isnan(candidates[:, :-1]).all(axis=1)] = np.inf
+    return scores
+
+def rank_tracks(track_ids, seed_track_ids, criteria, store):
+    """Return track_ids ordered by score_tracks, keeping the API order for ties."""
+    if not track_ids:
+        return []
+    scores = score_tracks(track_ids, seed_track_ids, criteria, store)
+    return [track_ids[i] for i in np.argsort(scores, kind='stable')]
+
+def filter_tracks_by_release_year(sp, tracks, min_year=None, max_year=None, store=None, catalog=None):
     """
     Filter tracks based on their album's release year.
     Since the Spotify Recommendations API doesn't support release year filters,
-    this function filters the recommended tracks manually.
+    this function filters the recommended tracks manually. Tracks that already
+    include their album, or whose year is in the catalog, are checked without
+    any request; only the unknown ones are fetched first.
     """
     if not min_year and not max_year:
         return tracks  # No filtering needed
 
+    if store is None:
+        store = TrackStore()
+    tracks = store.add_tracks(tracks)
     filtered_tracks = []
-    track_ids = [track['id'] for track in tracks]
-    try:
-        for i in range(0, len(track_ids), 50):
-            batch_ids = track_ids[i:i+50]
-            tracks_info = sp.tracks(batch_ids)['tracks']
-            for track in tracks_info:
-                release_date = track['album']['release_date']
-                release_year = int(release_date.split('-')[0])
-                if min_year and release_year < min_year:
-                    continue
-                if max_year and release_year > max_year:
-                    continue
-                filtered_tracks.append(track)
-            # To avoid hitting rate limits
-            time.sleep(0.1)
-    except spotipy.exceptions.SpotifyException as e:
-        print(f"Error filtering tracks by release year: {e}")
+    for track in get_tracks(sp, [track.id for track in tracks], store, catalog):
+        if min_year and track.release_year < min_year:
+            continue
+        if max_year and track.release_year > max_year:
+            continue
+        filtered_tracks.append(track)
     return filtered_tracks
 
-def main():
-    # Check for credentials
-    if os.path.exists('credentials.enc'):
-        try:
-            client_id, client_secret = load_credentials()
-        except Exception as e:
-            print(f"Error loading credentials: {e}")
-            return
-    else:
-        print("Spotify Developer Credentials are required.")
-        client_id = input("Enter your Spotify CLIENT_ID: ").strip()
-        client_secret = input("Enter your Spotify CLIENT_SECRET: ").strip()
-        save_credentials(client_id, client_secret)
-        print("Credentials saved securely.")
-
-    # Spotify authentication
-    REDIRECT_URI = 'http://localhost:8888/callback'
-    scope = 'playlist-modify-public playlist-modify-private'
+# Additional criteria: (name, prompt, type, minimum, maximum, label)
+CRITERIA = [
+    ('target_valence', "Enter target vibe (0.0 - 1.0 / sad - happy, optional): ", float, 0.0, 1.0, 'valence'),
+    ('target_popularity', "Enter target popularity (0 - 100, optional): ", int, 0, 100, 'popularity'),
+    ('min_tempo', "Enter minimum tempo in BPM (optional): ", float, None, None, 'minimum tempo'),
+    ('max_tempo', "Enter maximum tempo in BPM (optional): ", float, None, None, 'maximum tempo'),
+    ('target_energy', "Enter target energy (0.0 - 1.0, optional): ", float, 0.0, 1.0, 'energy'),
+    ('target_danceability', "Enter target danceability (0.0 - 1.0, optional): ", float, 0.0, 1.0, 'danceability'),
+    ('min_release_year', "Enter minimum release year (optional): ", int, None, None, 'minimum release year'),
+    ('max_release_year', "Enter maximum release year (optional): ", int, None, None, 'maximum release year'),
+]
+# Criteria applied locally rather than passed to the recommendations endpoint
+LOCAL_CRITERIA = ['min_release_year', 'max_release_year']
 
+def parse_criterion(criterion, value):
+    """Convert and range-check a criterion value. Returns None if it's invalid."""
+    name, prompt, cast, low, high, label = criterion
     try:
-        sp = spotipy.Spotify(auth_manager=SpotifyOAuth(client_id=client_id,
-                                                       client_secret=client_secret,
-                                                       redirect_uri=REDIRECT_URI,
-                                                       scope=scope))
-    except spotipy.exceptions.SpotifyException as e:
-        print(f"Authentication failed: {e}")
-        return
-
-    if len(sys.argv) != 2:
-        print("Usage: python m3u_recommender_playlist.py <path_to_m3u_playlist_or_audio_file_or_folder>")
-        return
-
-    input_path = sys.argv[1]
-
-    if not os.path.exists(input_path):
-        print("File or directory not found. Please check the path and try again.")
-        return
+        val = cast(value)
+    except (TypeError, ValueError):
+        print(f"Invalid input for {label}. Skipping this criterion.")
+        return None
+    if low is not None and not low <= val <= high:
+        print(f"{label.capitalize()} must be between {low} and {high}. Skipping this criterion.")
+        return None
+    return val
 
-    tracks = get_input_tracks(input_path)
-    if not tracks:
-        print("No valid tracks found in the input.")
-        return
+def validate_criteria(criteria):
+    """Validate a dict of criteria, e.g. from a job manifest, dropping invalid entries."""
+    known = {criterion[0]: criterion for criterion in CRITERIA}
+    valid = {}
+    for name, value in (criteria or {}).items():
+        if name not in known:
+            print(f"Unknown criterion '{name}'. Skipping this criterion.")
+            continue
+        val = parse_criterion(known[name], value)
+        if val is not None:
+            valid[name] = val
+    return valid
 
-    input_length = len(tracks)
-    print(f"Number of input tracks: {input_length}")
+def prompt_criteria():
+    """Ask the user for additional criteria for the recommendations."""
+    criteria = {}
+    add_criteria = input("Do you want to specify additional criteria for the recommendations? (yes/no): ").strip().lower()
+    if add_criteria in ['yes', 'y']:
+        for criterion in CRITERIA:
+            value = input(criterion[1]).strip()
+            if value:
+                val = parse_criterion(criterion, value)
+                if val is not None:
+                    criteria[criterion[0]] = val
+    else:
+        print("Proceeding without additional criteria.")
+    return criteria
 
-    # Prompt for maximum playlist length
+def prompt_max_length(input_length):
+    """Ask the user for the maximum playlist length."""
     max_length_input = input(f"Enter the maximum length of the playlist (default is {input_length}): ").strip()
     if max_length_input:
         try:
@@ -290,221 +1608,1010 @@ def main():
             max_length = input_length
     else:
         max_length = input_length
+    return max_length
 
-    all_recommended_track_ids = set()
-    all_recommended_artist_ids = set()
-    batch_size = 5  # Maximum seeds per API call
+class Caches:
+    """The persistent caches shared by every job in this process."""
 
-    print("\nProcessing input and generating recommendations...")
+    def __init__(self, enabled=True, ttl_days=SEARCH_CACHE_TTL_DAYS, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.search = open_search_cache(ttl_days, max_entries) if enabled else None
+        self.tags = open_tag_index() if enabled else None
+        self.index = open_track_index(max_entries) if enabled else None
+        self.genres = open_genre_cache(ttl_days) if enabled else None
+        self.catalog = open_catalog(ttl_days) if enabled else None
 
-    # Collect additional criteria from the user
-    additional_params = {}
-    min_release_year = None
-    max_release_year = None
+    def close(self):
+        for cache in (self.search, self.tags, self.genres, self.catalog, self.index and self.index.cache):
+            if cache is not None:
+                cache.close()
 
-    add_criteria = input("Do you want to specify additional criteria for the recommendations? (yes/no): ").strip().lower()
-    if add_criteria in ['yes', 'y']:
-        # Target Valence
-        target_valence = input("Enter target vibe (0.0 - 1.0 / sad - happy, optional): ").strip()
-        if target_valence:
-            try:
-                val = float(target_valence)
-                if 0.0 <= val <= 1.0:
-                    additional_params['target_valence'] = val
-                else:
-                    print("Valence must be between 0.0 and 1.0. Skipping this criterion.")
-            except ValueError:
-                print("Invalid input for valence. Skipping this criterion.")
+class RunJournal:
+    """
+    An append-only log of a run's progress: the options, each seed track found
+    on Spotify, the recommendations for each batch of seeds, the picked tracks,
+    the playlist and each batch added to it. Every record is a JSON line flushed as soon as it's written,
+    so a run that dies can be resumed from its last record. The records of
+    changes made to the user's account are also synced to disk, so they
+    survive a crash of the whole machine.
+    """
+    SYNCED_RECORDS = ('playlist', 'batch')
 
-        # Target Popularity
-        target_popularity = input("Enter target popularity (0 - 100, optional): ").strip()
-        if target_popularity:
-            try:
-                val = int(target_popularity)
-                if 0 <= val <= 100:
-                    additional_params['target_popularity'] = val
-                else:
-                    print("Popularity must be between 0 and 100. Skipping this criterion.")
-            except ValueError:
-                print("Invalid input for popularity. Skipping this criterion.")
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.options = None
+        self.seeds = {}
+        self.recommendations = {}
+        self.picks = None
+        self.playlist = None
+        self.batches = set()
+        if resume and os.path.exists(path):
+            self._load()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
 
-        # Min Tempo
-        min_tempo = input("Enter minimum tempo in BPM (optional): ").strip()
-        if min_tempo:
-            try:
-                val = float(min_tempo)
-                additional_params['min_tempo'] = val
-            except ValueError:
-                print("Invalid input for minimum tempo. Skipping this criterion.")
+    def _load(self):
+        """
+        Apply every complete record. An incomplete last line, left by a run that
+        died while writing it, is cut off so the resumed run's records start on
+        a line of their own.
+        """
+        complete = 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("unterminated record")
+                    entry = json.loads(line)
+                except ValueError:
+                    print(f"Ignoring an incomplete record at the end of {self.path}.")
+                    break
+                self._apply(entry)
+                complete = file.tell()
+        if complete < os.path.getsize(self.path):
+            os.truncate(self.path, complete)
 
-        # Max Tempo
-        max_tempo = input("Enter maximum tempo in BPM (optional): ").strip()
-        if max_tempo:
-            try:
-                val = float(max_tempo)
-                additional_params['max_tempo'] = val
-            except ValueError:
-                print("Invalid input for maximum tempo. Skipping this criterion.")
+    def _apply(self, entry):
+        kind = entry.pop('type')
+        if kind == 'options':
+            self.options = entry
+        elif kind == 'seed':
+            self.seeds[entry['index']] = entry
+        elif kind == 'recommendations':
+            self.recommendations[recommendations_key(entry['seeds'], entry['limit'])] = entry['tracks']
+        elif kind == 'picks':
+            self.picks = entry
+        elif kind == 'playlist':
+            self.playlist = entry
+        elif kind == 'batch':
+            self.batches.add(entry['offset'])
 
-        # Target Energy
-        target_energy = input("Enter target energy (0.0 - 1.0, optional): ").strip()
-        if target_energy:
-            try:
-                val = float(target_energy)
-                if 0.0 <= val <= 1.0:
-                    additional_params['target_energy'] = val
-                else:
-                    print("Energy must be between 0.0 and 1.0. Skipping this criterion.")
-            except ValueError:
-                print("Invalid input for energy. Skipping this criterion.")
+    @property
+    def resumed(self):
+        """Whether any progress was loaded from an earlier run."""
+        return bool(self.options or self.seeds or self.recommendations or self.picks or self.playlist)
 
-        # Target Danceability
-        target_danceability = input("Enter target danceability (0.0 - 1.0, optional): ").strip()
-        if target_danceability:
-            try:
-                val = float(target_danceability)
-                if 0.0 <= val <= 1.0:
-                    additional_params['target_danceability'] = val
-                else:
-                    print("Danceability must be between 0.0 and 1.0. Skipping this criterion.")
-            except ValueError:
-                print("Invalid input for danceability. Skipping this criterion.")
+    def record(self, kind, **fields):
+        """Append a record and flush it, syncing it to disk if it records a change to the account."""
+        with self.lock:
+            self.file.write(json.dumps({'type': kind, **fields}) + '\n')
+            self.file.flush()
+            if kind in self.SYNCED_RECORDS:
+                os.fsync(self.file.fileno())
+            self._apply({'type': kind, **fields})
 
-        # Minimum Release Year
-        min_release_year_input = input("Enter minimum release year (optional): ").strip()
-        if min_release_year_input:
-            try:
-                min_release_year = int(min_release_year_input)
-            except ValueError:
-                print("Invalid input for minimum release year. Skipping this criterion.")
+    def seed(self, index, track):
+        """Return the recorded Spotify ID of the seed track at index, or None."""
+        entry = self.seeds.get(index)
+        if entry is None or (entry['artist'], entry['title']) != (track['artist'], track['title']):
+            return None
+        return entry['seed_track_id']
 
-        # Maximum Release Year
-        max_release_year_input = input("Enter maximum release year (optional): ").strip()
-        if max_release_year_input:
-            try:
-                max_release_year = int(max_release_year_input)
-            except ValueError:
-                print("Invalid input for maximum release year. Skipping this criterion.")
-    else:
-        print("Proceeding without additional criteria.")
+    def batch(self, seeds, limit):
+        """Return the recorded recommendations for a batch of seeds, or None."""
+        return self.recommendations.get(recommendations_key(seeds, limit))
 
-    # Initialize a list to keep track of recommendations per seed track
-    recommendations_per_seed = {}
+    def close(self):
+        self.file.close()
 
-    # Ensure at least one recommendation per seed track
-    for idx, track in enumerate(tracks):
-        if len(all_recommended_track_ids) >= max_length:
-            break
-        print(f"\nProcessing seed track {idx + 1}/{input_length}: {track['artist']} - {track['title']}")
-        seed_track_id = search_track(sp, track['artist'], track['title'])
-        if seed_track_id:
-            recommendations = get_recommendations(sp, [seed_track_id], additional_params)
-            # Filter by release year if specified
-            if min_release_year or max_release_year:
-                recommendations = filter_tracks_by_release_year(sp, recommendations, min_release_year, max_release_year)
-            for rec_track in recommendations:
-                if rec_track['id'] not in all_recommended_track_ids:
-                    all_recommended_track_ids.add(rec_track['id'])
-                    # Collect artist IDs
-                    for artist in rec_track['artists']:
-                        all_recommended_artist_ids.add(artist['id'])
-                    break  # Ensure at least one recommendation per seed
+    def finish(self):
+        """Close and delete the journal once the run is complete."""
+        self.close()
+        os.remove(self.path)
+
+def recommendations_key(seeds, limit):
+    return f"{','.join(seeds)}:{limit}"
+
+def open_run_journal(key, resume=False):
+    """
+    Open the journal of the run identified by key, a JSON-serializable description
+    of its input. With resume, progress recorded by an earlier run is loaded;
+    otherwise any earlier journal for the same run is discarded.
+    """
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    journal = RunJournal(os.path.join(JOURNAL_DIR, f'{digest}.jsonl'), resume)
+    if resume:
+        if journal.resumed:
+            print(f"Resuming the interrupted run from {journal.path}.")
         else:
-            print(f"Seed track not found on Spotify: {track['artist']} - {track['title']}")
-
-    # After ensuring at least one recommendation per seed, fill up to max_length if needed
-    if len(all_recommended_track_ids) < max_length:
-        remaining = max_length - len(all_recommended_track_ids)
-        print(f"\nFetching additional recommendations to reach the desired playlist length ({max_length})...")
-        seed_track_ids = []
-        for track in tracks:
-            track_id = search_track(sp, track['artist'], track['title'])
-            if track_id:
-                seed_track_ids.append(track_id)
+            print("No interrupted run found for this input. Starting from the beginning.")
+    return journal
+
+def recommend(sp, tracks, max_length, criteria, caches, workers=DEFAULT_WORKERS, store=None, rank=True,
+              journal=None):
+    """
+    Generate up to max_length recommended track IDs for the input tracks,
+    with at least one recommendation per seed track found on Spotify.
+    Up to `workers` seed tracks are looked up on Spotify at the same time.
+    Seeds are then packed into batches of 5 by artist, and each batch is one
+    recommendations request for its share of max_length.
+    If rank is set and NumPy is available, candidates are ordered by their audio
+    features' distance to the seed tracks and the target criteria; otherwise
+    Spotify's order is kept.
+    If a journal is given, the seed tracks, the recommendations and the final
+    picks are recorded in it, and whatever it already records isn't fetched again.
+    Returns the recommended track IDs and a dict mapping each of their artists'
+    IDs to the number of recommended tracks by that artist.
+    """
+    if journal is not None and journal.picks is not None:
+        print("Reusing the recommendations of the interrupted run.")
+        return journal.picks['track_ids'], journal.picks['artist_counts']
+
+    input_length = len(tracks)
+    additional_params = {name: value for name, value in criteria.items() if name not in LOCAL_CRITERIA}
+    min_release_year = criteria.get('min_release_year')
+    max_release_year = criteria.get('max_release_year')
+    if store is None:
+        store = TrackStore()
+    if rank and np is None:
+        print("NumPy is not installed, so recommendations are kept in Spotify's order.")
+        rank = False
+
+    # Insertion-ordered, so the playlist follows the order the tracks were picked in
+    all_recommended_track_ids = {}
+    # Artist of each seed track found on Spotify, in input order
+    seed_artists = {}
+    # Seed batches with their recommended track IDs
+    candidates_per_batch = []
+
+    def pick(track_id):
+        all_recommended_track_ids[track_id] = None
+
+    # Seeds are looked up concurrently, but results are merged in input order.
+    def process_seed(item):
+        idx, track = item
+        seed_track_id = journal.seed(idx, track) if journal is not None else None
+        if seed_track_id is not None:
+            return track, seed_track_id, True
+        return track, search_track(sp, track['artist'], track['title'], caches.search, store, caches.index), False
+
+    with metrics.stage('seed tracks'), closing(bounded_map(process_seed, enumerate(tracks), workers)) as results:
+        for idx, (track, seed_track_id, replayed) in enumerate(results):
+            print(f"\nProcessing seed track {idx + 1}/{input_length}: {track['artist']} - {track['title']}")
+            if not seed_track_id:
+                # Misses aren't recorded; a failed lookup may succeed next time
+                print(f"Seed track not found on Spotify: {track['artist']} - {track['title']}")
+                continue
+            if journal is not None and not replayed:
+                journal.record('seed', index=idx, artist=track['artist'], title=track['title'],
+                               seed_track_id=seed_track_id)
+            seed_artists.setdefault(seed_track_id, normalize_text(clean_seed(track['artist'], track['title'])[0]))
+    seed_track_ids = list(seed_artists)
+
+    def fetch_batch(item):
+        batch, limit = item
+        recorded = journal.batch(batch, limit) if journal is not None else None
+        if recorded is not None:
+            return batch, limit, store.add_tracks(TrackRecord.from_dict(track) for track in recorded), True
+        recommendations = get_recommendations(sp, batch, additional_params, store=store, limit=limit)
+        # Filter by release year if specified
+        if min_release_year or max_release_year:
+            recommendations = filter_tracks_by_release_year(sp, recommendations, min_release_year, max_release_year,
+                                                            store, caches.catalog)
+        return batch, limit, recommendations, False
+
+    def fetch_batches(requests):
+        """Yield (batch, candidate IDs) for each batch request, in order, journaling new results."""
+        with closing(bounded_map(fetch_batch, requests, workers)) as results:
+            for batch, limit, recommendations, replayed in results:
+                if journal is not None and recommendations and not replayed:
+                    journal.record('recommendations', seeds=batch, limit=limit,
+                                   tracks=[rec_track.to_dict() for rec_track in recommendations])
+                yield batch, list(dict.fromkeys(rec_track.id for rec_track in recommendations))
+
+    # Each batch of up to 5 similar seeds is one request, asking for the batch's
+    # share of the playlist rather than the maximum of 100 tracks
+    seed_batches = schedule_seed_batches(seed_artists)
+    requests = [(batch, recommendation_limit(max_length, len(batch), len(seed_track_ids))) for batch in seed_batches]
+    with metrics.stage('recommendations'):
+        for batch, candidates in fetch_batches(requests):
+            candidates_per_batch.append((batch, candidates))
+    # One request per batch instead of one per seed
+    store.saved('recommendations', len(seed_track_ids) - len(seed_batches))
+
+    pool = list(dict.fromkeys(track_id for _, candidates in candidates_per_batch for track_id in candidates))
+    if rank and pool:
+        # Score the whole pool at once
+        with metrics.stage('ranking'):
+            get_audio_features(sp, seed_track_ids + pool, store, workers)
+            score_of = dict(zip(pool, score_tracks(pool, seed_track_ids, criteria, store).tolist()))
+        pool.sort(key=score_of.get)
+    else:
+        score_of = {track_id: position for position, track_id in enumerate(pool)}
+
+    # Ensure at least one recommendation per seed: each batch contributes
+    # its best unused candidate for every seed in it. Seeds a batch has too
+    # few candidates for are starved, and get requests of their own below.
+    starved = []
+    for batch, candidates in candidates_per_batch:
+        unused = sorted((track_id for track_id in candidates if track_id not in all_recommended_track_ids),
+                        key=score_of.get)
+        for track_id in unused[:len(batch)]:
+            pick(track_id)
+        starved.extend(batch[len(unused):])
+    # Places are kept for the starved seeds
+    for track_id in pool:
+        if len(all_recommended_track_ids) >= max_length - len(starved):
+            break
+        if track_id not in all_recommended_track_ids:
+            pick(track_id)
+
+    # Duplicates and filters can leave seeds without a track and the playlist
+    # short. Ask again with differently packed seeds each round, until there's
+    # enough or a round brings nothing new
+    if starved or len(all_recommended_track_ids) < max_length:
         if seed_track_ids:
-            # To comply with Spotify's 5 seed limit, we'll fetch recommendations in batches
-            # and accumulate unique tracks until we reach the desired length
-            additional_recommendations = get_recommendations(sp, seed_track_ids, additional_params)
-            # Filter by release year if specified
-            if min_release_year or max_release_year:
-                additional_recommendations = filter_tracks_by_release_year(sp, additional_recommendations, min_release_year, max_release_year)
-            for rec_track in additional_recommendations:
-                if len(all_recommended_track_ids) >= max_length:
-                    break
-                if rec_track['id'] not in all_recommended_track_ids:
-                    all_recommended_track_ids.add(rec_track['id'])
-                    # Collect artist IDs
-                    for artist in rec_track['artists']:
-                        all_recommended_artist_ids.add(artist['id'])
+            print(f"\nFetching additional recommendations to reach the desired playlist length ({max_length})...")
+            # Every seed was already looked up above, so reuse their IDs instead of searching again
+            store.saved('search', input_length)
         else:
             print("No valid seed tracks available for additional recommendations.")
+        asked = {tuple(batch) for batch, limit in requests if limit >= MAX_RECOMMENDATIONS}
+        fill_rounds = [
+            # Starved seeds on their own, and the batches asking for all they can get
+            [([seed], MAX_RECOMMENDATIONS) for seed in starved]
+            + [(batch, MAX_RECOMMENDATIONS) for batch, limit in requests if limit < MAX_RECOMMENDATIONS],
+            # Then every seed on its own
+            [([seed], MAX_RECOMMENDATIONS) for seed in seed_track_ids],
+        ]
+        for fill_requests in fill_rounds:
+            if not starved and len(all_recommended_track_ids) >= max_length:
+                break
+            fill_requests = [(batch, limit) for batch, limit in fill_requests if tuple(batch) not in asked]
+            asked.update(tuple(batch) for batch, _ in fill_requests)
+            if not fill_requests:
+                continue
+            needed = max_length - len(all_recommended_track_ids)
+            waiting = set(starved)
+            own_candidates = []
+            additional_ids = {}
+            with metrics.stage('fill recommendations'):
+                for batch, candidates in fetch_batches(fill_requests):
+                    fresh = [track_id for track_id in candidates if track_id not in all_recommended_track_ids]
+                    if len(batch) == 1 and batch[0] in waiting:
+                        waiting.discard(batch[0])
+                        own_candidates.append((batch[0], fresh))
+                    additional_ids.update(dict.fromkeys(fresh))
+                    # Stop once every starved seed was asked and there are enough candidates
+                    if not waiting and len(additional_ids) >= needed * RECOMMENDATION_OVERFETCH:
+                        break
+            if not additional_ids:
+                break
+            additional_ids = list(additional_ids)
+            if rank:
+                with metrics.stage('ranking'):
+                    get_audio_features(sp, additional_ids, store, workers)
+                    additional_ids = rank_tracks(additional_ids, seed_track_ids, criteria, store)
+            position = {track_id: i for i, track_id in enumerate(additional_ids)}
+            for seed, candidates in own_candidates:
+                unused = [track_id for track_id in candidates if track_id not in all_recommended_track_ids]
+                if unused:
+                    pick(min(unused, key=position.get))
+                    starved.remove(seed)
+            for track_id in additional_ids:
+                if len(all_recommended_track_ids) >= max_length - len(starved):
+                    break
+                if track_id not in all_recommended_track_ids:
+                    pick(track_id)
+
+    if starved:
+        print(f"No recommendations matched the criteria for {len(starved)} of the seed tracks.")
+    if seed_track_ids and len(all_recommended_track_ids) < max_length:
+        print(f"Only {len(all_recommended_track_ids)} of the {max_length} requested tracks could be found.")
 
-    if all_recommended_track_ids:
+    track_ids = list(all_recommended_track_ids)[:max_length]
+    artist_counts = dict(Counter(artist_id for track_id in track_ids
+                                 for artist_id in store.get_track(track_id).artist_ids))
+    if journal is not None:
+        journal.record('picks', track_ids=track_ids, artist_counts=artist_counts)
+    return track_ids, artist_counts
+
+def print_tracks(sp, track_ids, store=None, catalog=None):
+    """Print 'Artists - Title' for each track."""
+    with metrics.stage('track details'):
+        tracks = get_tracks(sp, track_ids, store, catalog)
+    for track in tracks:
+        artists = ', '.join(track.artist_names)
+        print(f"{artists} - {track.name}")
+
+def suggest_playlist_name(sp, artist_counts, store=None, cache=None):
+    """
+    Build a playlist name from the most common genres of the recommended tracks.
+    artist_counts maps artist IDs to their number of tracks, so each genre
+    counts once per track rather than once per artist.
+    """
+    with metrics.stage('genres'):
+        genres_of = get_genres(sp, list(artist_counts), store, cache)
+    # Count genre frequencies, weighted by each artist's number of tracks
+    genre_counts = Counter()
+    for artist_id, genres in genres_of.items():
+        for genre in genres:
+            genre_counts[genre] += artist_counts[artist_id]
+    if genre_counts:
+        # Get top genres
+        top_genres = [genre.title() for genre, count in genre_counts.most_common(3)]
+        # Build the playlist name
+        genre_part = ', '.join(top_genres)
+    else:
+        genre_part = "Various Genres"
+
+    # Get current date and time
+    current_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    # Build default playlist name
+    default_playlist_name = f"{genre_part} Playlist {current_datetime}"
+    # Ensure playlist name isn't too long
+    max_length_name = 100
+    if len(default_playlist_name) > max_length_name:
+        default_playlist_name = default_playlist_name[:max_length_name]
+    return default_playlist_name
+
+def run(sp, tracks, caches, workers=DEFAULT_WORKERS, rank=True, journal=None, update_playlist_id=None):
+    """
+    Interactively generate recommendations for the input tracks and create the playlist,
+    or, if update_playlist_id is given, make that existing playlist match them.
+    When resuming from a journal, the answers recorded in it are reused instead of prompting.
+    """
+    input_length = len(tracks)
+    print(f"Number of input tracks: {input_length}")
+
+    if journal is not None and journal.options is not None:
+        max_length = journal.options['max_length']
+        criteria = journal.options['criteria']
+        print(f"Using the options of the interrupted run (maximum length {max_length}).")
+    else:
+        # Prompt for maximum playlist length
+        max_length = prompt_max_length(input_length)
+
+        print("\nProcessing input and generating recommendations...")
+
+        # Collect additional criteria from the user
+        criteria = prompt_criteria()
+        if journal is not None:
+            journal.record('options', max_length=max_length, criteria=criteria)
+
+    # Every track and artist object received during this run
+    store = TrackStore()
+    track_ids_list, artist_counts = recommend(sp, tracks, max_length, criteria, caches, workers, store, rank,
+                                           journal)
+
+    if track_ids_list and update_playlist_id:
+        print("\nRecommended Tracks:")
+        print_tracks(sp, track_ids_list, store, caches.catalog)
+
+        print("\nUpdating the playlist on your Spotify account...")
+        with metrics.stage('playlist writes'):
+            result = sync_playlist(sp, update_playlist_id, track_ids_list)
+        if result is None:
+            print("Failed to read the playlist. Exiting.")
+            return
+        print(f"Playlist updated: {result['added']} tracks added, {result['removed']} removed, "
+              f"{result['kept']} unchanged.")
+        if result['added'] < result['to_add'] or result['removed'] < result['to_remove']:
+            print("Some changes could not be sent. Run again to finish the update.")
+            return
+        if journal is not None:
+            journal.finish()
+    elif track_ids_list:
         try:
-            user_id = sp.me()['id']
+            user_id = spotify_call(sp.me)['id']
         except spotipy.exceptions.SpotifyException as e:
             print(f"Error fetching user ID: {e}")
             return
 
-        # New code to print the recommended tracks before creating the playlist
+        # Print the recommended tracks before creating the playlist
         print("\nRecommended Tracks:")
-        recommended_tracks = []
-        track_ids_list = list(all_recommended_track_ids)[:max_length]
-        for i in range(0, len(track_ids_list), 50):  # Spotify API limit
-            batch_ids = track_ids_list[i:i+50]
-            try:
-                tracks_info = sp.tracks(batch_ids)['tracks']
-                for track in tracks_info:
-                    track_name = track['name']
-                    artists = ', '.join([artist['name'] for artist in track['artists']])
-                    print(f"{artists} - {track_name}")
-                    recommended_tracks.append({'name': track_name, 'artists': artists})
-                # To avoid hitting rate limits
-                time.sleep(0.1)
-            except spotipy.exceptions.SpotifyException as e:
-                print(f"Error fetching track details: {e}")
-                continue
+        print_tracks(sp, track_ids_list, store, caches.catalog)
 
-        print("\nAnalyzing genres of the recommended tracks...")
-        genres = get_genres(sp, list(all_recommended_artist_ids))
-        if genres:
-            # Count genre frequencies
-            genre_counts = Counter(genres)
-            # Get top genres
-            top_genres = [genre.title() for genre, count in genre_counts.most_common(3)]
-            # Build the playlist name
-            genre_part = ', '.join(top_genres)
+        if journal is not None and journal.playlist is not None:
+            playlist_id = journal.playlist['playlist_id']
+            playlist_name = journal.playlist['name']
+            print(f"\nContinuing the playlist '{playlist_name}' created by the interrupted run...")
         else:
-            genre_part = "Various Genres"
-
-        # Get current date and time
-        current_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-        # Build default playlist name
-        default_playlist_name = f"{genre_part} Playlist {current_datetime}"
-        # Ensure playlist name isn't too long
-        max_length_name = 100
-        if len(default_playlist_name) > max_length_name:
-            default_playlist_name = default_playlist_name[:max_length_name]
-
-        print(f"\nSuggested playlist name: '{default_playlist_name}'")
-        playlist_name = input("Enter a name for the new playlist (press Enter to accept the suggested name): ").strip()
-        if not playlist_name:
-            playlist_name = default_playlist_name
-
-        playlist_description = input("Enter a description for the new playlist (optional): ").strip()
-
-        print("\nCreating new playlist on your Spotify account...")
-        playlist_id = create_playlist(sp, user_id, playlist_name, playlist_description)
-        if not playlist_id:
-            print("Failed to create playlist. Exiting.")
-            return
+            print("\nAnalyzing genres of the recommended tracks...")
+            default_playlist_name = suggest_playlist_name(sp, artist_counts, store, caches.genres)
+
+            print(f"\nSuggested playlist name: '{default_playlist_name}'")
+            playlist_name = input("Enter a name for the new playlist (press Enter to accept the suggested name): ").strip()
+            if not playlist_name:
+                playlist_name = default_playlist_name
+
+            playlist_description = input("Enter a description for the new playlist (optional): ").strip()
+
+            print("\nCreating new playlist on your Spotify account...")
+            with metrics.stage('playlist writes'):
+                playlist_id = create_playlist(sp, user_id, playlist_name, playlist_description)
+            if not playlist_id:
+                print("Failed to create playlist. Exiting.")
+                return
+            if journal is not None:
+                journal.record('playlist', playlist_id=playlist_id, name=playlist_name)
 
         print("Adding recommended tracks to the new playlist...")
-        add_tracks_to_playlist(sp, playlist_id, track_ids_list)
+        with metrics.stage('playlist writes'):
+            added = add_tracks_to_playlist(sp, playlist_id, track_ids_list, journal)
 
+        if added < len(track_ids_list):
+            print(f"Only {added} of {len(track_ids_list)} tracks were added to '{playlist_name}'. "
+                  "Run again with --resume to add the rest.")
+            return
         print(f"Playlist '{playlist_name}' created successfully with {len(track_ids_list)} tracks!")
+        if journal is not None:
+            journal.finish()
     else:
         print("No recommended tracks found. Playlist not created.")
+    store.report()
+
+# Types of the fields of a manifest job, with how they're described in errors
+MANIFEST_FIELDS = {
+    'input': (str, "a path"),
+    'max_length': (int, "a positive integer"),
+    'criteria': (dict, "an object"),
+    'rank': (bool, "true or false"),
+    'playlist_id': (str, "a string"),
+    'name': (str, "a string"),
+    'description': (str, "a string"),
+}
+
+def manifest_field_error(fields):
+    """Return why the fields of a manifest job or its defaults are invalid, or None if they're fine."""
+    for name, (kind, description) in MANIFEST_FIELDS.items():
+        value = fields.get(name)
+        if value is None:
+            continue
+        # bool is an int subclass, but true isn't a length
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)) \
+                or (name == 'max_length' and value < 1):
+            return f"'{name}' must be {description}, not {value!r}."
+    return None
+
+def load_manifest(manifest_path):
+    """
+    Load a batch job manifest from a JSON or YAML file. The manifest is either a
+    list of jobs or an object with a "jobs" list and optional "defaults" that
+    apply to every job. Returns the list of jobs, or None if the manifest is invalid.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            if os.path.splitext(manifest_path)[1].lower() in ['.yaml', '.yml']:
+                try:
+                    import yaml
+                except ImportError:
+                    print("PyYAML is required for YAML manifests. Install it with 'pip install pyyaml' or use JSON.")
+                    return None
+                manifest = yaml.safe_load(file)
+            else:
+                manifest = json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading manifest {manifest_path}: {e}")
+        return None
+
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('jobs'), list):
+        print("The manifest must be a list of jobs or an object with a 'jobs' list.")
+        return None
+
+    defaults = manifest.get('defaults') or {}
+    if not isinstance(defaults, dict):
+        print("The manifest's 'defaults' must be an object.")
+        return None
+    error = manifest_field_error(defaults)
+    if error:
+        print(f"Invalid defaults in the manifest: {error}")
+        return None
+    jobs = []
+    for idx, job in enumerate(manifest['jobs']):
+        if not isinstance(job, dict) or not job.get('input'):
+            print(f"Job {idx + 1} in the manifest has no 'input'.")
+            return None
+        error = manifest_field_error(job)
+        if error:
+            print(f"Invalid job {idx + 1} in the manifest: {error}")
+            return None
+        merged = {**defaults, **job}
+        merged['criteria'] = {**(defaults.get('criteria') or {}), **(job.get('criteria') or {})}
+        jobs.append(merged)
+    return jobs
+
+def run_job(sp, user_id, job, caches, workers=DEFAULT_WORKERS, resume=False):
+    """
+    Run one batch job without prompting and return a summary of the result.
+    Progress is journaled; with resume, an interrupted run of the same job continues where it stopped.
+    """
+    started = time.monotonic()
+    summary = {'input': job.get('input'), 'status': 'failed', 'playlist_id': None, 'playlist_name': None,
+               'input_tracks': 0, 'tracks_added': 0, 'tracks_removed': 0, 'api_calls_saved': 0, 'error': None}
+    journal = None
+    try:
+        input_path = summary['input'] = os.path.expanduser(job['input'])
+        if not os.path.exists(input_path):
+            summary['error'] = "File or directory not found."
+            return summary
+        with metrics.stage('parse input'):
+            tracks = get_input_tracks(input_path, caches.tags, workers)
+            input_length = len(tracks)
+        summary['input_tracks'] = input_length
+        if not input_length:
+            summary['status'] = 'no_tracks'
+            return summary
+
+        max_length = job.get('max_length') or input_length
+        if max_length < input_length:
+            print(f"Maximum length cannot be less than the number of input tracks ({input_length}). Using default.")
+            max_length = input_length
+        criteria = validate_criteria(job.get('criteria'))
+
+        journal = open_run_journal({'input': os.path.abspath(input_path), 'job': job}, resume)
+        store = TrackStore()
+        track_ids_list, artist_counts = recommend(sp, tracks, max_length, criteria, caches, workers, store,
+                                               job.get('rank', True), journal)
+        summary['api_calls_saved'] = sum(store.calls_saved.values())
+        if not track_ids_list:
+            summary['status'] = 'no_recommendations'
+            return summary
+
+        if job.get('playlist_id'):
+            with metrics.stage('playlist writes'):
+                result = sync_playlist(sp, job['playlist_id'], track_ids_list)
+            summary['api_calls_saved'] = sum(store.calls_saved.values())
+            summary['playlist_id'] = job['playlist_id']
+            if result is None:
+                summary['error'] = "Failed to read the playlist."
+                return summary
+            summary.update(tracks_added=result['added'], tracks_removed=result['removed'])
+            if result['added'] < result['to_add'] or result['removed'] < result['to_remove']:
+                summary['error'] = "Some changes could not be sent."
+                return summary
+            summary['status'] = 'ok'
+            journal.finish()
+            print(f"Playlist {job['playlist_id']} updated: {result['added']} tracks added, "
+                  f"{result['removed']} removed, {result['kept']} unchanged.")
+            return summary
+
+        with metrics.stage('playlist writes'):
+            if journal.playlist is not None:
+                playlist_id, playlist_name = journal.playlist['playlist_id'], journal.playlist['name']
+            else:
+                playlist_name = job.get('name') or suggest_playlist_name(sp, artist_counts, store, caches.genres)
+                playlist_id = create_playlist(sp, user_id, playlist_name, job.get('description', ''))
+                if not playlist_id:
+                    summary['error'] = "Failed to create playlist."
+                    return summary
+                journal.record('playlist', playlist_id=playlist_id, name=playlist_name)
+            summary['tracks_added'] = add_tracks_to_playlist(sp, playlist_id, track_ids_list, journal)
+        summary['api_calls_saved'] = sum(store.calls_saved.values())
+        summary.update(playlist_id=playlist_id, playlist_name=playlist_name)
+        if summary['tracks_added'] < len(track_ids_list):
+            summary['error'] = f"Only {summary['tracks_added']} of {len(track_ids_list)} tracks were added."
+            return summary
+        summary['status'] = 'ok'
+        journal.finish()
+        print(f"Playlist '{playlist_name}' created successfully with {summary['tracks_added']} tracks!")
+    except Exception as e:
+        print(f"Error running job for {input_path}: {e}")
+        summary['error'] = str(e)
+    finally:
+        if journal is not None:
+            journal.close()
+        summary['elapsed_seconds'] = round(time.monotonic() - started, 3)
+    return summary
+
+def run_batch(sp, jobs, caches, workers=DEFAULT_WORKERS, concurrent_jobs=1, resume=False):
+    """Run every job of a manifest, up to concurrent_jobs at a time, and return a summary."""
+    started = time.monotonic()
+    try:
+        user_id = spotify_call(sp.me)['id']
+    except spotipy.exceptions.SpotifyException as e:
+        print(f"Error fetching user ID: {e}")
+        return None
+
+    def process_job(job):
+        return run_job(sp, user_id, job, caches, workers, resume)
+
+    results = list(bounded_map(process_job, jobs, concurrent_jobs))
+    succeeded = sum(1 for result in results if result['status'] == 'ok')
+    return {
+        'jobs': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+    }
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class RecommendationServer:
+    """
+    Serves recommendations over HTTP, keeping one authenticated client, the
+    caches and the track store warm between requests.
+
+    POST /recommend takes a JSON object with "tracks" (a list of
+    {"artist": ..., "title": ...} objects or "Artist - Title" strings) or "m3u"
+    (the text of a playlist), and optionally "max_length", "criteria" and
+    "rank". A plain M3U body is accepted too. It returns the recommended track
+    IDs in playlist order. GET /health and GET /metrics report the server's state.
+    """
+
+    def __init__(self, sp, caches, workers=DEFAULT_WORKERS, rank=True):
+        self.sp = sp
+        self.caches = caches
+        self.workers = workers
+        self.rank = rank
+        self.store = TrackStore()
+        self.inflight = {}
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        addresses = ', '.join(f'{sock.getsockname()[0]}:{sock.getsockname()[1]}' for sock in server.sockets)
+        print(f"Serving recommendations on {addresses}. Press Ctrl-C to stop.")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection, keeping it open between requests."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                started = time.monotonic()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {'error': "Malformed request line."}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                # Only bodies with a Content-Length are read; anything else would
+                # leave the body on the connection, to be parsed as the next request
+                if 'transfer-encoding' in headers:
+                    await self.respond(writer, 411, {'error': "Send the body with a Content-Length."},
+                                       keep_alive=False)
+                    break
+                length = headers.get('content-length') or '0'
+                if not length.isdigit():
+                    await self.respond(writer, 400, {'error': "Invalid Content-Length."}, keep_alive=False)
+                    break
+                length = int(length)
+                if length > MAX_REQUEST_BYTES:
+                    await self.respond(writer, 413, {'error': "Request body too large."}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.dispatch(method, urlparse(target).path, headers, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, status, payload, keep_alive)
+                print(f'"{method} {target}" {status} {(time.monotonic() - started) * 1000:.1f} ms', file=sys.stderr)
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive=True):
+        if isinstance(payload, str):
+            content_type, body = 'text/plain; version=0.0.4', payload.encode('utf-8')
+        else:
+            content_type, body = 'application/json', json.dumps(payload).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def dispatch(self, method, path, headers, body):
+        """Return the status and payload (a dict, or text for /metrics) of a request."""
+        routes = {'/health': 'GET', '/metrics': 'GET', '/recommend': 'POST'}
+        if path not in routes:
+            return 404, {'error': f"Unknown path {path}."}
+        if method != routes[path]:
+            return 405, {'error': f"Use {routes[path]} for {path}."}
+        if path == '/health':
+            return 200, {'status': 'ok', 'in_flight': len(self.inflight), 'stored_tracks': len(self.store.tracks)}
+        if path == '/metrics':
+            return 200, metrics.to_prometheus()
+        try:
+            request = self.parse_request(headers, body)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        # Identical concurrent requests share one computation
+        key = json.dumps(request, sort_keys=True)
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(self.recommend, **request))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        try:
+            return 200, await asyncio.shield(task)
+        except Exception as e:
+            print(f"Error generating recommendations: {e}", file=sys.stderr)
+            return 500, {'error': str(e)}
+
+    def parse_request(self, headers, body):
+        """Turn a request body into recommend() arguments, raising ValueError if it's invalid."""
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type in ['audio/x-mpegurl', 'audio/mpegurl', 'application/vnd.apple.mpegurl'] \
+                or body.lstrip(b'\xef\xbb\xbf').startswith(b'#EXTM3U'):
+            request = {'m3u': body}
+        else:
+            try:
+                request = json.loads(body)
+            except ValueError:
+                raise ValueError("The body must be a JSON object or an M3U playlist.")
+            if not isinstance(request, dict):
+                raise ValueError("The body must be a JSON object.")
+
+        if request.get('m3u') is not None:
+            m3u = request['m3u']
+            if not isinstance(m3u, (bytes, str)):
+                raise ValueError("m3u must be the text of a playlist.")
+            lines = (m3u if isinstance(m3u, bytes) else m3u.encode('utf-8')).splitlines()
+            # Entries name files on the client's machine, not the server's
+            tracks = list(parse_m3u_entries(iter_m3u_lines(lines), None))
+        else:
+            items = request.get('tracks')
+            if items is None:
+                items = []
+            if not isinstance(items, list):
+                raise ValueError("tracks must be a list.")
+            tracks = []
+            for item in items:
+                if isinstance(item, str):
+                    tracks.append(track_from_filename(item))
+                elif isinstance(item, dict) and (item.get('artist') or item.get('title')):
+                    tracks.append({'artist': str(item.get('artist') or 'unknown artist'),
+                                   'title': str(item.get('title') or 'unknown title')})
+                else:
+                    raise ValueError("Each track must be an 'Artist - Title' string or an object with artist and title.")
+        if not tracks:
+            raise ValueError("No tracks given.")
+
+        max_length = request.get('max_length') or len(tracks)
+        if not isinstance(max_length, int) or isinstance(max_length, bool):
+            raise ValueError("max_length must be an integer.")
+        if not isinstance(request.get('criteria') or {}, dict):
+            raise ValueError("criteria must be an object.")
+        return {
+            'tracks': tracks,
+            'max_length': max(max_length, len(tracks)),
+            'criteria': validate_criteria(request.get('criteria')),
+            'rank': bool(request.get('rank', self.rank)),
+        }
+
+    def recommend(self, tracks, max_length, criteria, rank):
+        """Run the recommendation pipeline for one request (in a worker thread)."""
+        if len(self.store.tracks) > SERVER_STORE_MAX_TRACKS:
+            self.store = TrackStore()
+        track_ids, artist_counts = recommend(self.sp, tracks, max_length, criteria, self.caches, self.workers,
+                                             self.store, rank)
+        return {'track_ids': track_ids, 'artist_counts': artist_counts, 'input_tracks': len(tracks)}
+
+def get_spotify_client(interactive=True, pool_size=DEFAULT_POOL_SIZE, read_timeout=DEFAULT_READ_TIMEOUT):
+    """
+    Load the saved credentials and build an authenticated Spotify client.
+    API and token requests share one pooled session.
+    """
+    # Check for credentials
+    if os.path.exists('credentials.enc'):
+        try:
+            client_id, client_secret = load_credentials()
+        except Exception as e:
+            print(f"Error loading credentials: {e}")
+            return None
+    elif interactive:
+        print("Spotify Developer Credentials are required.")
+        client_id = input("Enter your Spotify CLIENT_ID: ").strip()
+        client_secret = input("Enter your Spotify CLIENT_SECRET: ").strip()
+        save_credentials(client_id, client_secret)
+        print("Credentials saved securely.")
+    else:
+        print("Spotify Developer Credentials are required. Run Seedify interactively once to save them.")
+        return None
+
+    # Spotify authentication
+    REDIRECT_URI = 'http://localhost:8888/callback'
+    scope = 'playlist-modify-public playlist-modify-private'
+
+    from spotipy.oauth2 import SpotifyOAuth
+
+    session = build_session(pool_size)
+    timeout = (CONNECT_TIMEOUT, read_timeout)
+    try:
+        return spotipy.Spotify(auth_manager=SpotifyOAuth(client_id=client_id,
+                                                         client_secret=client_secret,
+                                                         redirect_uri=REDIRECT_URI,
+                                                         scope=scope,
+                                                         requests_session=session,
+                                                         requests_timeout=timeout),
+                               requests_session=session,
+                               requests_timeout=timeout)
+    except spotipy.exceptions.SpotifyException as e:
+        print(f"Authentication failed: {e}")
+        return None
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Generate a Spotify playlist from an M3U playlist, an audio file or a folder of audio files."
+    )
+    parser.add_argument('input_path', nargs='?', help="path to an M3U playlist, an audio file or a folder")
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help="run every job in a JSON or YAML manifest without prompting")
+    parser.add_argument('--jobs', type=int, default=2,
+                        help="number of batch jobs run at the same time (default 2)")
+    parser.add_argument('--summary', default='-',
+                        help="file to write the JSON batch summary to (default: standard output)")
+    parser.add_argument('--serve', metavar='PORT', type=int,
+                        help="serve recommendations over HTTP on PORT instead of creating a playlist")
+    parser.add_argument('--host', default=DEFAULT_SERVE_HOST,
+                        help=f"address to listen on with --serve (default {DEFAULT_SERVE_HOST})")
+    parser.add_argument('--update', metavar='PLAYLIST_ID',
+                        help="update an existing playlist (ID, URI or URL) instead of creating a new one")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run of the same input or manifest instead of starting over")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="don't read or write the persistent caches (searches, file tags, "
+                             "track index, genres and track catalog)")
+    parser.add_argument('--cache-ttl-days', type=float, default=SEARCH_CACHE_TTL_DAYS,
+                        help=f"days before a cached search result or artist's genres expire (default {SEARCH_CACHE_TTL_DAYS})")
+    parser.add_argument('--cache-max-entries', type=int, default=SEARCH_CACHE_MAX_ENTRIES,
+                        help=f"maximum number of cached search results and indexed tracks (default {SEARCH_CACHE_MAX_ENTRIES})")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"number of concurrent Spotify requests (default {DEFAULT_WORKERS}, 1 disables concurrency)")
+    parser.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                        help=f"maximum Spotify requests per second (default {DEFAULT_MAX_RATE:g})")
+    parser.add_argument('--pool-size', type=int,
+                        help=f"HTTP connections kept open to Spotify (default: the larger of {DEFAULT_POOL_SIZE} "
+                             f"and --workers times --jobs)")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_READ_TIMEOUT,
+                        help=f"seconds to wait for a Spotify response (default {DEFAULT_READ_TIMEOUT:g})")
+    parser.add_argument('--no-rank', action='store_true',
+                        help="keep Spotify's order instead of ranking candidates by their audio features")
+    parser.add_argument('--profile', action='store_true',
+                        help="print timings and Spotify API statistics when finished")
+    parser.add_argument('--metrics-json', metavar='FILE',
+                        help="write timings and API statistics to a JSON file when finished")
+    parser.add_argument('--metrics-prom', metavar='FILE',
+                        help="write timings and API statistics to a Prometheus textfile when finished")
+    args = parser.parse_args(argv)
+    if sum(option is not None for option in (args.input_path, args.batch, args.serve)) != 1:
+        parser.error("provide either an input path, --batch MANIFEST or --serve PORT")
+    if args.update and args.serve is not None:
+        parser.error("--update can't be combined with --serve")
+    if args.pool_size is None:
+        args.pool_size = max(DEFAULT_POOL_SIZE, args.workers * args.jobs)
+    for name in ('workers', 'jobs', 'cache_max_entries', 'pool_size'):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} must be at least 1")
+    if args.max_rate <= 0 or args.cache_ttl_days <= 0 or args.timeout <= 0:
+        parser.error("--max-rate, --cache-ttl-days and --timeout must be positive")
+    if args.update and args.batch:
+        parser.error("--update can't be combined with --batch; set playlist_id on the jobs instead")
+    return args
+
+def main():
+    args = parse_args()
+    rate_limiter.configure(args.max_rate)
+    try:
+        if args.batch:
+            main_batch(args)
+        elif args.serve is not None:
+            main_serve(args)
+        else:
+            main_interactive(args)
+    finally:
+        write_metrics(args)
+
+def write_metrics(args):
+    """Emit the profile report and metric files requested on the command line."""
+    if args.profile:
+        print("\n" + metrics.report(), file=sys.stderr)
+    if args.metrics_json:
+        write_file_atomically(args.metrics_json, json.dumps(metrics.to_dict(), indent=2) + '\n')
+    if args.metrics_prom:
+        write_file_atomically(args.metrics_prom, metrics.to_prometheus())
+
+def main_interactive(args):
+    """
+    Generate one playlist, prompting for the options. The input is checked and
+    parsed before authenticating, so a bad path fails fast.
+    """
+    input_path = args.input_path
+
+    if not os.path.exists(input_path):
+        print("File or directory not found. Please check the path and try again.")
+        return
+
+    caches = Caches(not args.no_cache, args.cache_ttl_days, args.cache_max_entries)
+    try:
+        with metrics.stage('parse input'):
+            tracks = get_input_tracks(input_path, caches.tags, args.workers)
+            found = bool(tracks)
+        if not found:
+            print("No valid tracks found in the input.")
+            return
+        sp = get_spotify_client(pool_size=args.pool_size, read_timeout=args.timeout)
+        if sp is None:
+            return
+        journal_key = {'input': os.path.abspath(input_path), 'update': args.update}
+        with closing(open_run_journal(journal_key, args.resume)) as journal:
+            run(sp, tracks, caches, args.workers, not args.no_rank, journal, args.update)
+    finally:
+        caches.close()
+
+def main_batch(args):
+    """Run a batch manifest. Progress goes to stderr and the JSON summary to --summary."""
+    jobs = load_manifest(args.batch)
+    if jobs is None:
+        sys.exit(1)
+    for job in jobs:
+        job.setdefault('rank', not args.no_rank)
+
+    sp = get_spotify_client(interactive=False, pool_size=args.pool_size, read_timeout=args.timeout)
+    if sp is None:
+        sys.exit(1)
+
+    caches = Caches(not args.no_cache, args.cache_ttl_days, args.cache_max_entries)
+    try:
+        with redirect_stdout(sys.stderr):
+            summary = run_batch(sp, jobs, caches, args.workers, args.jobs, args.resume)
+    finally:
+        caches.close()
+    if summary is None:
+        sys.exit(1)
+
+    output = json.dumps(summary, indent=2)
+    if args.summary == '-':
+        print(output)
+    else:
+        with open(args.summary, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    if summary['failed']:
+        sys.exit(1)
+
+def main_serve(args):
+    """Serve recommendations over HTTP until interrupted. Logs go to stderr."""
+    sp = get_spotify_client(interactive=False, pool_size=args.pool_size, read_timeout=args.timeout)
+    if sp is None:
+        sys.exit(1)
+
+    # Keep recommendations for a while, so repeated seeds cost no requests
+    recommendation_flights.configure(RECOMMENDATION_TTL_SECONDS)
+    caches = Caches(not args.no_cache, args.cache_ttl_days, args.cache_max_entries)
+    server = RecommendationServer(sp, caches, args.workers, not args.no_rank)
+    try:
+        with redirect_stdout(sys.stderr):
+            asyncio.run(server.serve(args.host, args.serve))
+    except KeyboardInterrupt:
+        print("Stopped.", file=sys.stderr)
+    finally:
+        caches.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,34 @@
+import json
+
+import benchmark
+import seedify
+
+
+def run_job(sp):
+    caches = seedify.Caches(enabled=False)
+    try:
+        return seedify.run_job(sp, 'benchmark-user', {'input': 'in.m3u', 'name': 'Replay'}, caches, workers=1)
+    finally:
+        caches.close()
+
+
+def test_recorded_session_replays_without_misses(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(seedify.rate_limiter, 'max_rate', 1e6)
+    monkeypatch.setattr(seedify.rate_limiter, 'rate', 1e6)
+    benchmark.write_m3u('in.m3u', 20)
+
+    # A catalogue unlike the default one, so synthetic answers can't pass for recorded ones
+    recorder = benchmark.RecordingSpotify(benchmark.FakeSpotify(catalog_size=777))
+    recorded = run_job(recorder)
+    recorder.save('recording.json')
+    with open('recording.json', 'r', encoding='utf-8') as file:
+        recording = json.load(file)
+
+    replay = benchmark.FakeSpotify(recording=recording)
+    replayed = run_job(replay)
+
+    assert not replay.replay_misses
+    assert replay.calls['search'] == 20
+    assert replayed['playlist_id'] == recorded['playlist_id']
+    assert replay.playlists[replayed['playlist_id']] == recorder.sp.playlists[recorded['playlist_id']]
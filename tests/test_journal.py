@@ -0,0 +1,57 @@
+import json
+
+import seedify
+
+
+def write_torn_journal(path):
+    journal = seedify.RunJournal(str(path))
+    journal.record('options', max_length=10, criteria={})
+    journal.record('seed', index=0, artist='A', title='T', seed_track_id='t0')
+    journal.close()
+    # The run dies halfway through writing the next record
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write('{"type": "seed", "index": 1, "art')
+
+
+def test_torn_write_is_cut_off_before_appending(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_torn_journal(path)
+
+    journal = seedify.RunJournal(str(path), resume=True)
+    assert journal.resumed
+    assert list(journal.seeds) == [0]
+    journal.record('seed', index=1, artist='B', title='U', seed_track_id='t1')
+    journal.close()
+
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            json.loads(line)
+
+
+def test_resume_twice_after_torn_write_keeps_resumed_progress(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_torn_journal(path)
+
+    journal = seedify.RunJournal(str(path), resume=True)
+    journal.record('seed', index=1, artist='B', title='U', seed_track_id='t1')
+    journal.record('picks', track_ids=['r1', 'r2'], artist_counts={'a1': 2})
+    journal.record('playlist', playlist_id='p1', name='Mix')
+    journal.record('batch', offset=0)
+    journal.close()
+
+    journal = seedify.RunJournal(str(path), resume=True)
+    assert journal.seed(1, {'artist': 'B', 'title': 'U'}) == 't1'
+    assert journal.picks['track_ids'] == ['r1', 'r2']
+    assert journal.playlist['playlist_id'] == 'p1'
+    assert journal.batches == {0}
+    journal.close()
+
+
+def test_without_resume_the_journal_starts_over(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_torn_journal(path)
+
+    journal = seedify.RunJournal(str(path))
+    assert not journal.resumed
+    journal.close()
+    assert path.read_text(encoding='utf-8') == ''
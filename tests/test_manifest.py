@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+import seedify
+
+
+def load(tmp_path, manifest):
+    path = tmp_path / 'jobs.json'
+    path.write_text(json.dumps(manifest), encoding='utf-8')
+    return seedify.load_manifest(str(path))
+
+
+@pytest.mark.parametrize('manifest', [
+    [{'input': 5}],
+    [{'input': 'a.m3u', 'criteria': ['target_energy', 0.5]}],
+    [{'input': 'a.m3u', 'max_length': '50'}],
+    [{'input': 'a.m3u', 'max_length': 0}],
+    [{'input': 'a.m3u', 'max_length': True}],
+    [{'input': 'a.m3u', 'rank': 'no'}],
+    [{'input': 'a.m3u', 'name': ['Mix']}],
+    [{'title': 'a.m3u'}],
+    ['a.m3u'],
+    {'defaults': ['max_length', 50], 'jobs': [{'input': 'a.m3u'}]},
+    {'defaults': {'criteria': 'energy'}, 'jobs': [{'input': 'a.m3u'}]},
+    {'defaults': {'max_length': -1}, 'jobs': [{'input': 'a.m3u'}]},
+])
+def test_invalid_manifests_are_rejected(tmp_path, manifest, capsys):
+    assert load(tmp_path, manifest) is None
+    assert capsys.readouterr().out
+
+
+def test_defaults_are_merged_into_jobs(tmp_path):
+    jobs = load(tmp_path, {
+        'defaults': {'max_length': 50, 'criteria': {'target_energy': 0.5}},
+        'jobs': [{'input': 'a.m3u', 'criteria': {'target_valence': 0.2}}, {'input': 'b', 'max_length': 80}],
+    })
+    assert jobs[0]['max_length'] == 50
+    assert jobs[0]['criteria'] == {'target_energy': 0.5, 'target_valence': 0.2}
+    assert jobs[1]['max_length'] == 80
@@ -0,0 +1,57 @@
+import pytest
+
+import seedify
+
+
+@pytest.mark.parametrize('artist, title, expected', [
+    ('Artist', '01 - Title', ('Artist', 'Title')),
+    ('Artist', '01 Title', ('Artist', 'Title')),
+    ('Artist', '1. Title', ('Artist', 'Title')),
+    ('Artist', '1-02 Title', ('Artist', 'Title')),
+    ('Artist', '01-Title', ('Artist', 'Title')),
+    ('01', 'Artist - Title', ('Artist', 'Title')),
+    ('01 - Artist', 'Title', ('Artist', 'Title')),
+    ('Artist', 'Title (feat. Guest)', ('Artist', 'Title')),
+    ('Artist', 'Title [ft. Guest]', ('Artist', 'Title')),
+    ('Artist ft. Guest', 'Title', ('Artist', 'Title')),
+    ('Artist feat. Guest', 'Title feat. Guest', ('Artist', 'Title')),
+    ('Artist', 'Title (Remastered 2011)', ('Artist', 'Title')),
+    ('Artist', 'Title - Radio Edit', ('Artist', 'Title')),
+    ('XTC', 'Feat of Clay', ('XTC', 'Feat of Clay')),
+    ('Little Feat Band', 'Dixie Chicken', ('Little Feat Band', 'Dixie Chicken')),
+    ("The 5.6.7.8's", 'Woo Hoo', ("The 5.6.7.8's", 'Woo Hoo')),
+    ("5.6.7.8's", 'Woo Hoo', ("5.6.7.8's", 'Woo Hoo')),
+    ('10.000 Maniacs', 'Like the Weather', ('10.000 Maniacs', 'Like the Weather')),
+    ('Artist', '2-Step', ('Artist', '2-Step')),
+    ('Nena', '99 Luftballons', ('Nena', '99 Luftballons')),
+    ('', '', ('unknown artist', 'unknown title')),
+])
+def test_clean_seed(artist, title, expected):
+    assert seedify.clean_seed(artist, title) == expected
+
+
+def seed_score(artist, title, candidate_artists, candidate_title):
+    artist, title = seedify.clean_seed(artist, title)
+    candidate = {'name': candidate_title, 'artists': [{'name': name} for name in candidate_artists]}
+    return seedify.match_score(seedify.normalize_text(artist), seedify.normalize_text(title),
+                               *seedify.track_names(candidate))
+
+
+@pytest.mark.parametrize('seed, candidate, matches', [
+    (('Artist', '01 - Title (Remastered)'), (['Artist'], 'Title - Remastered 2009'), True),
+    (('Beyonce & Jay-Z', 'Drunk in Love'), (['Beyoncé and JAY Z'], 'Drunk in Love'), True),
+    (('10.000 Maniacs', 'Like the Weather'), (['10,000 Maniacs'], 'Like the Weather'), True),
+    (("The 5.6.7.8's", 'Woo Hoo'), (["The 5.6.7.8's"], 'Woo Hoo'), True),
+    (('XTC', 'Feat of Clay'), (['XTC'], 'Feat of Clay'), True),
+    (('Artist', 'Song 5'), (['Artist'], 'Song 15'), False),
+    (('Artist', 'Title'), (['Someone Else'], 'Another Song'), False),
+    (('Metallica', 'One'), (['U2'], 'One'), False),
+    (('Radiohead', 'Creep'), (['TLC'], 'Creep'), False),
+    (('Adele', 'Hello'), (['Lionel Richie'], 'Hello'), False),
+    (('Daft Punk, Pharrell Williams', 'Get Lucky'), (['Daft Punk', 'Pharrell Williams', 'Nile Rodgers'], 'Get Lucky'),
+     True),
+    (('unknown artist', 'Get Lucky'), (['Daft Punk'], 'Get Lucky'), True),
+])
+def test_match_score(seed, candidate, matches):
+    score = seed_score(*seed, *candidate)
+    assert (score >= seedify.SEARCH_MATCH_THRESHOLD) == matches
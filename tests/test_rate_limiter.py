@@ -0,0 +1,64 @@
+import pytest
+import spotipy
+
+import seedify
+
+
+def failing(status, headers):
+    calls = []
+
+    def track(track_id):
+        calls.append(track_id)
+        raise spotipy.exceptions.SpotifyException(status, -1, 'error', headers=headers)
+    return track, calls
+
+
+def test_server_errors_are_not_treated_as_throttling():
+    limiter = seedify.RateLimiter(max_rate=100)
+    track, calls = failing(503, {})
+    with pytest.raises(spotipy.exceptions.SpotifyException):
+        limiter.call(track, 'abc')
+    assert len(calls) == 1
+    assert limiter.rate == 100
+
+
+def test_exhausted_urllib3_retries_are_not_treated_as_throttling():
+    # spotipy turns a RetryError into a 429 without response headers
+    limiter = seedify.RateLimiter(max_rate=100)
+    track, calls = failing(429, None)
+    with pytest.raises(spotipy.exceptions.SpotifyException):
+        limiter.call(track, 'abc')
+    assert len(calls) == 1
+    assert limiter.rate == 100
+
+
+def test_throttling_is_retried_and_slows_down(monkeypatch):
+    monkeypatch.setattr(seedify.time, 'sleep', lambda seconds: None)
+    limiter = seedify.RateLimiter(max_rate=100, max_retries=2)
+    track, calls = failing(429, {'Retry-After': '0'})
+    with pytest.raises(spotipy.exceptions.SpotifyException):
+        limiter.call(track, 'abc')
+    assert len(calls) == 3
+    assert limiter.rate == 25
+
+
+def test_throttled_rate_stays_below_a_low_max_rate():
+    limiter = seedify.RateLimiter(max_rate=0.2)
+    for _ in range(5):
+        limiter.on_throttled(0)
+    assert limiter.rate <= 0.2
+    limiter.configure(0.1)
+    limiter.on_throttled(0)
+    assert limiter.rate <= 0.1
+
+
+def test_long_retry_after_is_not_waited_out(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(seedify.time, 'sleep', sleeps.append)
+    limiter = seedify.RateLimiter(max_rate=100)
+    track, calls = failing(429, {'Retry-After': '3600'})
+    with pytest.raises(spotipy.exceptions.SpotifyException):
+        limiter.call(track, 'abc')
+    assert len(calls) == 1
+    assert sleeps == []
+    assert limiter.blocked_until < seedify.time.monotonic() + seedify.MAX_RETRY_AFTER
@@ -0,0 +1,64 @@
+import pytest
+
+import benchmark
+import seedify
+
+
+class TracingSpotify(benchmark.FakeSpotify):
+    """Remembers which seeds each recommended track came from."""
+
+    def __init__(self):
+        super().__init__()
+        self.sources = {}
+
+    def recommendations(self, seed_tracks=None, **kwargs):
+        result = super().recommendations(seed_tracks=seed_tracks, **kwargs)
+        for track in result['tracks']:
+            self.sources.setdefault(track['id'], set()).update(seed_tracks)
+        return result
+
+
+def distinct_track_per_seed(seeds, track_ids, sources):
+    """Whether every seed can be paired with a different track recommended for it (Kuhn's matching)."""
+    owner = {}
+
+    def assign(seed, seen):
+        for track_id in track_ids:
+            if seed in sources[track_id] and track_id not in seen:
+                seen.add(track_id)
+                if track_id not in owner or assign(owner[track_id], seen):
+                    owner[track_id] = seed
+                    return True
+        return False
+
+    return all(assign(seed, set()) for seed in seeds)
+
+
+@pytest.fixture(autouse=True)
+def unlimited_rate(monkeypatch):
+    monkeypatch.setattr(seedify.rate_limiter, 'max_rate', 1e6)
+    monkeypatch.setattr(seedify.rate_limiter, 'rate', 1e6)
+
+
+@pytest.mark.parametrize('max_length', [30, 60, 100])
+def test_every_seed_gets_a_track_within_a_year_window(max_length, capsys):
+    tracks = [{'artist': f'Artist {i}', 'title': f'Song {i}'} for i in range(30)]
+    sp = TracingSpotify()
+    store = seedify.TrackStore()
+    criteria = {'min_release_year': 2000, 'max_release_year': 2005}
+    track_ids, _ = seedify.recommend(sp, tracks, max_length, criteria, seedify.Caches(enabled=False), 1, store)
+
+    assert len(track_ids) == max_length
+    assert all(2000 <= store.get_track(track_id).release_year <= 2005 for track_id in track_ids)
+    seeds = {seedify.search_track(sp, track['artist'], track['title']) for track in tracks}
+    assert distinct_track_per_seed(seeds, track_ids, sp.sources)
+    assert 'could be found' not in capsys.readouterr().out
+
+
+def test_short_playlist_is_reported(capsys):
+    tracks = [{'artist': 'Artist', 'title': 'Song'}]
+    criteria = {'min_release_year': 2000, 'max_release_year': 2000}
+    track_ids, _ = seedify.recommend(benchmark.FakeSpotify(), tracks, 100, criteria,
+                                     seedify.Caches(enabled=False), 1)
+    assert len(track_ids) < 100
+    assert f"Only {len(track_ids)} of the 100 requested tracks could be found." in capsys.readouterr().out
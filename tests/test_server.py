@@ -0,0 +1,94 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import benchmark
+import seedify
+
+
+@pytest.fixture
+def server():
+    return seedify.RecommendationServer(sp=None, caches=seedify.Caches(enabled=False))
+
+
+@pytest.mark.parametrize('body', [
+    b'{"tracks": "abc"}',
+    b'{"tracks": {"artist": "A", "title": "T"}}',
+    b'{"tracks": [1, 2]}',
+    b'{"m3u": 5}',
+    b'{"tracks": []}',
+    b'["A - T"]',
+    b'not json',
+])
+def test_invalid_requests_are_rejected(server, body):
+    with pytest.raises(ValueError):
+        server.parse_request({'content-type': 'application/json'}, body)
+
+
+def test_tracks_and_playlists_are_parsed(server):
+    request = server.parse_request({}, b'{"tracks": ["A - T", {"artist": "B", "title": "U"}], "max_length": 5}')
+    assert request['tracks'] == [{'artist': 'A', 'title': 'T'}, {'artist': 'B', 'title': 'U'}]
+    assert request['max_length'] == 5
+    request = server.parse_request({'content-type': 'audio/x-mpegurl'}, b'#EXTM3U\n#EXTINF:1,A - T\nt.mp3\n')
+    assert request['tracks'][0]['artist'] == 'A'
+
+
+def test_playlist_entries_are_not_looked_up_on_the_server(server, tmp_path, monkeypatch):
+    (tmp_path / 'B - U.mp3').write_bytes(b'not really audio')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(seedify, 'parse_audio_file', lambda path: pytest.fail(f"opened {path}"))
+    body = b'#EXTM3U\nB - U.mp3\nC:\\Music\\C - V.flac\nfile:///music/D%20-%20W.ogg\n'
+    request = server.parse_request({'content-type': 'audio/x-mpegurl'}, body)
+    assert request['tracks'] == [
+        {'artist': 'B', 'title': 'U'}, {'artist': 'C', 'title': 'V'}, {'artist': 'D', 'title': 'W'},
+    ]
+
+
+def exchange(server, raw):
+    """Send raw bytes to the server and return everything it answers before closing."""
+    async def main():
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(raw)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return response
+    return asyncio.run(main())
+
+
+def test_bad_content_length_gets_an_answer(server):
+    response = exchange(server, b'POST /recommend HTTP/1.1\r\nContent-Length: abc\r\n\r\n{}')
+    assert response.startswith(b'HTTP/1.1 400 ')
+
+
+def test_chunked_body_is_refused_instead_of_parsed_as_a_request(server):
+    response = exchange(server, b'POST /recommend HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                b'11\r\n{"tracks": "abc"}\r\n0\r\n\r\n')
+    assert response.startswith(b'HTTP/1.1 411 ')
+    assert response.count(b'HTTP/1.1') == 1
+
+
+def test_keep_alive_serves_several_requests(server):
+    response = exchange(server, b'GET /health HTTP/1.1\r\n\r\n'
+                                b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')
+    assert response.count(b'HTTP/1.1 200 ') == 2
+
+
+def test_concurrent_requests_share_seed_lookups_and_recommendations(monkeypatch):
+    monkeypatch.setattr(seedify, 'recommendation_flights', seedify.SingleFlight(ttl=seedify.RECOMMENDATION_TTL_SECONDS))
+    monkeypatch.setattr(seedify.rate_limiter, 'max_rate', 1e6)
+    monkeypatch.setattr(seedify.rate_limiter, 'rate', 1e6)
+    sp = benchmark.FakeSpotify(latency=0.05)
+    server = seedify.RecommendationServer(sp, seedify.Caches(enabled=False), workers=4, rank=False)
+    tracks = [{'artist': f'Artist {i}', 'title': f'Song {i}'} for i in range(3)]
+
+    with ThreadPoolExecutor(2) as executor:
+        results = list(executor.map(lambda max_length: server.recommend(tracks, max_length, {}, False), [3, 50]))
+
+    assert sp.calls['search'] == 3
+    assert sp.calls['recommendations'] == 1
+    assert [len(result['track_ids']) for result in results] == [3, 50]
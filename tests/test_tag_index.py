@@ -0,0 +1,27 @@
+import os
+
+import seedify
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(b'not really audio')
+
+
+def test_rescan_forgets_deleted_files_under_the_folder_only(tmp_path):
+    music = tmp_path / 'music'
+    other = tmp_path / 'music2'
+    for path in (music / 'a.mp3', music / 'album' / 'b.mp3', other / 'c.mp3'):
+        touch(str(path))
+    index = seedify.DiskCache(path=str(tmp_path / 'cache.db'), table='tags')
+    try:
+        seedify.parse_audio_folder(str(music), index, workers=1)
+        seedify.parse_audio_folder(str(other), index, workers=1)
+        assert len(index.keys()) == 3
+
+        os.remove(music / 'album' / 'b.mp3')
+        seedify.parse_audio_folder(str(music), index, workers=1)
+        assert sorted(index.keys()) == sorted([str(music / 'a.mp3'), str(other / 'c.mp3')])
+    finally:
+        index.close()
@@ -0,0 +1,20 @@
+import seedify
+
+
+def spotify_track(track_id, artist, title):
+    return {'id': track_id, 'name': title, 'artists': [{'name': artist}]}
+
+
+def test_track_index_is_capped(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    index = seedify.TrackIndex(seedify.DiskCache(path=path, table='track_index', max_entries=2))
+    for track_id, artist, title in (('1', 'Metallica', 'One'), ('2', 'U2', 'One'), ('3', 'Blur', 'Song 2')):
+        index.add(spotify_track(track_id, artist, title))
+    index.cache.close()
+
+    reopened = seedify.TrackIndex(seedify.DiskCache(path=path, table='track_index', max_entries=2))
+    try:
+        assert len(reopened.cache.keys()) == 2
+        assert reopened.lookup('blur', 'song 2') == '3'
+    finally:
+        reopened.cache.close()